@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from excel_cache import CACHE_DIR
+from excel_renderer import render_plan_excel
+
+# 后台渲染线程数、内存中保留的已完成结果数、磁盘上保留的文件数
+RENDER_WORKERS = 1
+RENDER_RESULTS_KEPT = 8
+RENDER_FILES_KEPT = 16
+
+
+class BackgroundRenderer:
+    """
+    后台生成主计划 Excel：页面先展示汇总结果，xlsx 在后台线程中渲染。
+
+    - 以计划指纹 plan_key 去重：同一计划重复提交只渲染一次
+    - 渲染结果保存在内存（最近 RENDER_RESULTS_KEPT 份）及磁盘 {cache_dir}/renders/，重启后仍可复用
+    """
+
+    def __init__(self, cache_dir=None, workers=RENDER_WORKERS, results_kept=RENDER_RESULTS_KEPT):
+        self.root = os.path.join(cache_dir or CACHE_DIR, "renders")
+        self.results_kept = results_kept
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="excel-render")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, plan_key):
+        return os.path.join(self.root, f"{plan_key}.xlsx")
+
+    def _load(self, plan_key):
+        path = self._path(plan_key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _render(self, plan_key, cube):
+        content = render_plan_excel(cube).getvalue()
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{self._path(plan_key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self._path(plan_key))
+            self._prune()
+        except OSError:
+            # 缓存目录不可写时只保留内存结果
+            pass
+        return content
+
+    def _prune(self):
+        paths = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith(".xlsx")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[RENDER_FILES_KEPT:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, plan_key, cube):
+        """
+        提交渲染（已提交或已完成的计划直接返回原 Future），返回 concurrent.futures.Future。
+        """
+        with self._lock:
+            future = self._futures.get(plan_key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                self._futures.move_to_end(plan_key)
+                return future
+
+            content = self._load(plan_key)
+            if content is not None:
+                future = Future()
+                future.set_result(content)
+            else:
+                future = self._pool.submit(self._render, plan_key, cube)
+
+            self._futures[plan_key] = future
+            self._evict()
+            return future
+
+    def _evict(self):
+        # 只淘汰已完成的结果，进行中的渲染保留
+        while len(self._futures) > self.results_kept:
+            oldest = next((key for key, f in self._futures.items() if f.done()), None)
+            if oldest is None:
+                break
+            del self._futures[oldest]
+
+    def result(self, plan_key, timeout=None):
+        """
+        等待并返回渲染结果（bytes）；未提交过的计划返回 None。
+        """
+        with self._lock:
+            future = self._futures.get(plan_key)
+        return None if future is None else future.result(timeout=timeout)
+
+    def is_ready(self, plan_key):
+        with self._lock:
+            future = self._futures.get(plan_key)
+        return future is not None and future.done()
+
+
+default_renderer = BackgroundRenderer()
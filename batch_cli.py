@@ -0,0 +1,212 @@
+"""
+无页面的批量主计划生成：按清单（manifest）并行生成多份主计划 Excel，不导入 Streamlit。
+
+用法：
+    python batch_cli.py manifest.json --workers 4 --summary batch_summary.json
+
+清单格式（JSON）：
+    {
+        "defaults": {"template": "预测分析.xlsx", "mapping": "新旧料号.xlsx", "plan_year": 2025, "output_dir": "out"},
+        "jobs": [
+            {"name": "bu1-base", "forecast": "bu1/预测.xlsx", "order": "bu1/未交订单.xlsx", "sales": "bu1/出货明细.xlsx"},
+            {"name": "bu1-high", "forecast": "bu1/预测_high.xlsx", "order": "bu1/未交订单.xlsx",
+             "sales": "bu1/出货明细.xlsx", "output": "out/bu1_high.xlsx", "exports": ["parquet:long", "csv:wide"]}
+        ]
+    }
+
+exports 为额外的列式导出（格式:布局），写在 Excel 同目录，文件名如 bu1_high.long.parquet。
+
+每个任务的输入缺省时取 defaults，仍缺省则与页面一致从 GitHub 下载；相对路径相对于清单所在目录。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from excel_cache import content_hash
+from excel_renderer import render_plan_excel
+from github_utils import INPUT_SPECS, fetch_file_bytes, read_excel_bytes
+from info_extract import PLAN_YEAR
+from pivot_processor import PivotProcessor
+from plan_export import EXPORT_FORMATS, EXPORT_LAYOUTS, export_file_name
+
+BATCH_WORKERS = min(4, os.cpu_count() or 1)
+
+JOB_INPUTS = ("template", "forecast", "order", "sales", "mapping")
+
+# 工作进程内共享的已编译料号索引：{新旧料号表摘要: PartNumberIndex}
+_SHARED_INDEXES = {}
+
+
+def load_manifest(path):
+    """
+    读取清单，合并 defaults，返回任务列表（输入路径已转为绝对路径）。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get("defaults", {})
+    jobs = manifest.get("jobs", [])
+    if not jobs:
+        raise ValueError(f"❌ 清单中没有任务：{path}")
+
+    resolved, names = [], set()
+    for i, job in enumerate(jobs):
+        job = {**defaults, **job}
+        name = job.get("name") or f"job-{i + 1}"
+        if name in names:
+            raise ValueError(f"❌ 清单中任务名重复：{name}")
+        names.add(name)
+
+        inputs = {
+            key: os.path.join(base_dir, job[key]) if job.get(key) else None
+            for key in JOB_INPUTS
+        }
+        output = job.get("output") or os.path.join(job.get("output_dir", "."), f"{name}.xlsx")
+        resolved.append({
+            "name": name,
+            "inputs": inputs,
+            "plan_year": int(job.get("plan_year", PLAN_YEAR)),
+            "output": os.path.join(base_dir, output),
+            "exports": [parse_export_spec(spec) for spec in job.get("exports", [])],
+        })
+    return resolved
+
+
+def parse_export_spec(spec):
+    """
+    "格式:布局"（如 "parquet:long"）→ (格式, 布局)；省略布局时为 long。
+    """
+    fmt, _, layout = spec.partition(":")
+    layout = layout or "long"
+    if fmt not in EXPORT_FORMATS or layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"❌ 无效的导出设置：{spec}，格式可选 {list(EXPORT_FORMATS)}，布局可选 {list(EXPORT_LAYOUTS)}")
+    return fmt, layout
+
+
+def read_input_bytes(file_key, path):
+    """
+    读取本地输入文件；path 为 None 时从 GitHub 下载。
+    """
+    if path is None:
+        return fetch_file_bytes(file_key)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def parse_input(file_key, content):
+    sheet_name, header = INPUT_SPECS[file_key]
+    return read_excel_bytes(content, sheet_name=sheet_name, header=header, file_key=file_key)
+
+
+def compile_mappings(jobs):
+    """
+    在主进程中按内容去重取得新旧料号索引（已编译过的直接加载编译产物），
+    返回 ({摘要: PartNumberIndex}, {任务名: 摘要})。
+    """
+    indexes, job_digests, by_path = {}, {}, {}
+    for job in jobs:
+        path = job["inputs"]["mapping"]
+        if path not in by_path:
+            content = read_input_bytes("mapping", path)
+            digest = content_hash(content)
+            if digest not in indexes:
+                indexes[digest] = PivotProcessor().load_mapping_content(content, digest)
+            by_path[path] = digest
+        job_digests[job["name"]] = by_path[path]
+    return indexes, job_digests
+
+
+def _init_worker(indexes):
+    # 每个工作进程只反序列化一次已编译的料号索引，供其处理的所有任务共用
+    _SHARED_INDEXES.update(indexes)
+
+
+def run_job(job, mapping_digest):
+    """
+    生成单个主计划并写出 Excel，返回任务摘要。
+    """
+    start = time.perf_counter()
+    frames = {
+        key: parse_input(key, read_input_bytes(key, job["inputs"][key]))
+        for key in ("template", "forecast", "order", "sales")
+    }
+    part_index = _SHARED_INDEXES[mapping_digest]
+
+    cube = PivotProcessor().build_plan(
+        frames["template"], frames["forecast"], frames["order"], frames["sales"], part_index,
+        plan_year=job["plan_year"]
+    )
+    output = render_plan_excel(cube)
+
+    os.makedirs(os.path.dirname(job["output"]) or ".", exist_ok=True)
+    with open(job["output"], "wb") as f:
+        f.write(output.getvalue())
+
+    exports = []
+    stem = os.path.splitext(job["output"])[0]
+    for fmt, layout in job["exports"]:
+        path = export_file_name(stem, fmt, layout)
+        with open(path, "wb") as f:
+            f.write(PivotProcessor().export(cube, fmt=fmt, layout=layout).getvalue())
+        exports.append(path)
+
+    return {
+        "name": job["name"],
+        "status": "ok",
+        "output": job["output"],
+        "exports": exports,
+        "skus": int(cube.shape[0]),
+        "months": [str(cube.months[0]), str(cube.months[-1])] if len(cube.months) else [],
+        "forecast_without_order": int(cube.forecast_without_order_mask().sum()),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run_batch(jobs, workers=BATCH_WORKERS):
+    """
+    以最多 workers 个进程并行执行任务；新旧料号表在主进程编译一次后分发给各进程。
+    返回按清单顺序排列的任务摘要列表，失败的任务 status 为 "error"。
+    """
+    indexes, job_digests = compile_mappings(jobs)
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs))),
+                             initializer=_init_worker, initargs=(indexes,)) as pool:
+        futures = {pool.submit(run_job, job, job_digests[job["name"]]): job["name"] for job in jobs}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                logging.info("✅ %s 完成（%.1f 秒）", name, results[name]["seconds"])
+            except Exception as e:
+                results[name] = {"name": name, "status": "error", "error": str(e)}
+                logging.error("❌ %s 失败：%s", name, e)
+
+    return [results[job["name"]] for job in jobs]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按清单批量生成主计划 Excel（无页面）")
+    parser.add_argument("manifest", help="任务清单 JSON")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="并行进程数上限")
+    parser.add_argument("--summary", help="任务摘要 JSON 输出路径")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    results = run_batch(load_manifest(args.manifest), workers=args.workers)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    failed = [r["name"] for r in results if r["status"] != "ok"]
+    print(f"完成 {len(results) - len(failed)} / {len(results)} 个任务" + (f"，失败：{failed}" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+主计划流程基准测试：按可配置规模生成合成输入，分阶段计时并统计内存峰值，输出可对比的 JSON。
+
+用法：
+    python benchmark.py --skus 2000 --months 12 --order-rows 50000 --sales-rows 200000
+    python benchmark.py --compare bench_baseline.json     # 与历史结果逐阶段对比
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from excel_cache import CACHE_DIR
+from excel_reader import REQUIRED_COLUMNS, pick_engine, read_excel_projected
+from excel_renderer import apply_forecast_order_highlight, render_plan_excel
+from github_utils import INPUT_SPECS
+from info_extract import extract_all_year_months, extract_source_facts
+from mapping_utils import PartNumberIndex, split_mapping_data
+from pivot_processor import PivotProcessor
+
+# 默认输出到本地缓存目录（已在 .gitignore 中），不在仓库根目录留下文件
+DEFAULT_OUTPUT = os.path.join(CACHE_DIR, "bench_output.json")
+
+MAPPING_COLUMNS = ["旧晶圆", "旧规格", "旧品名", "新晶圆", "新规格", "新品名", "封装厂", "PC", "封装形式", "半成品", "备注"]
+MAX_SUBSTITUTES = 4
+
+
+def generate_inputs(skus=1000, months=12, order_rows=20000, sales_rows=50000, substitutes=2,
+                    mapped_ratio=0.2, seed=0):
+    """
+    生成与真实输入结构一致的合成数据，返回 {file_key: DataFrame}。
+
+    - skus: 主计划模板中的品名数
+    - months: 预测 / 订单 / 出货覆盖的月份数（从 2025-01 起，最多 12 个月）
+    - order_rows / sales_rows: 订单、出货明细行数
+    - substitutes: 每条新旧料号记录的替代料号数（0~4）
+    - mapped_ratio: 有旧料号 / 替代料号的 SKU 比例，明细中会混入这些料号
+    """
+    if not 1 <= months <= 12:
+        raise ValueError("❌ months 需在 1~12 之间（预测表月份列为“x月预测”）")
+    if not 0 <= substitutes <= MAX_SUBSTITUTES:
+        raise ValueError(f"❌ substitutes 需在 0~{MAX_SUBSTITUTES} 之间")
+
+    rng = np.random.default_rng(seed)
+    names = np.array([f"P{i:06d}-{i % 97:02d}" for i in range(skus)], dtype=object)
+
+    template = pd.DataFrame({
+        "晶圆": [f"W{i % 50:03d}" for i in range(skus)],
+        "规格": [f"S{i % 200:03d}" for i in range(skus)],
+        "品名": names,
+    })
+
+    # 新旧料号：部分 SKU 有旧料号，并带若干替代料号
+    mapped = np.sort(rng.choice(skus, size=int(skus * mapped_ratio), replace=False))
+    mapping = pd.DataFrame(index=range(len(mapped)), columns=MAPPING_COLUMNS, dtype=object)
+    mapping["旧品名"] = [f"OLD-{i:06d}" for i in mapped]
+    mapping["新晶圆"] = template["晶圆"].to_numpy()[mapped]
+    mapping["新规格"] = template["规格"].to_numpy()[mapped]
+    mapping["新品名"] = names[mapped]
+    for j in range(1, MAX_SUBSTITUTES + 1):
+        for field in ("晶圆", "规格", "品名"):
+            mapping[f"替代{field}{j}"] = None
+        if j <= substitutes:
+            mapping[f"替代品名{j}"] = [f"SUB{j}-{i:06d}" for i in mapped]
+
+    # 明细中使用的品名：新料号为主，混入旧料号与替代料号
+    aliases = list(mapping["旧品名"])
+    for j in range(1, substitutes + 1):
+        aliases += list(mapping[f"替代品名{j}"])
+    aliases = np.array(aliases or names[:1].tolist(), dtype=object)
+
+    def source_names(n):
+        picked = rng.choice(names, size=n)
+        use_alias = rng.random(n) < mapped_ratio
+        picked[use_alias] = rng.choice(aliases, size=int(use_alias.sum()))
+        return picked
+
+    def dates(n):
+        start = pd.Timestamp("2025-01-01")
+        span = (start + pd.DateOffset(months=months) - start).days
+        return start + pd.to_timedelta(rng.integers(0, span, n), unit="D")
+
+    forecast = pd.DataFrame({
+        "产品型号": "M",
+        "生产料号": source_names(skus),
+        "档位": "A",
+    })
+    for m in range(1, months + 1):
+        values = rng.integers(0, 5000, skus).astype(float)
+        values[rng.random(skus) < 0.3] = np.nan
+        forecast[f"{m}月预测"] = values
+
+    order = pd.DataFrame({
+        "单号": [f"O{i // 5:07d}" for i in range(order_rows)],
+        "序号": [i % 5 + 1 for i in range(order_rows)],
+        "品名": source_names(order_rows),
+        "客户要求交期": dates(order_rows),
+        "订单数量": rng.integers(1, 10000, order_rows),
+    })
+
+    sales = pd.DataFrame({
+        "单号": [f"S{i // 5:07d}" for i in range(sales_rows)],
+        "序号": [i % 5 + 1 for i in range(sales_rows)],
+        "品名": source_names(sales_rows),
+        "交易日期": dates(sales_rows),
+        "数量": rng.integers(1, 10000, sales_rows),
+    })
+
+    return {"template": template, "forecast": forecast, "order": order, "sales": sales, "mapping": mapping}
+
+
+def to_workbook_bytes(frames):
+    """
+    按各输入文件的真实版式（工作表名、表头行，见 INPUT_SPECS）写成 xlsx，返回 {file_key: bytes}。
+    """
+    contents = {}
+    for key, df in frames.items():
+        sheet_name, header = INPUT_SPECS[key]
+        buffer = BytesIO()
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            df.to_excel(
+                writer, index=False, startrow=header,
+                sheet_name=sheet_name if isinstance(sheet_name, str) else "Sheet1"
+            )
+        contents[key] = buffer.getvalue()
+    return contents
+
+
+def _measure(func, repeat, memory):
+    """
+    运行 repeat 次取耗时；memory=True 时另跑一次统计 tracemalloc 峰值（不计入耗时）。
+    """
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+
+    return result, {
+        "seconds": min(timings),
+        "mean_seconds": sum(timings) / len(timings),
+        "peak_mb": None if peak_mb is None else round(peak_mb, 3),
+    }
+
+
+def _shape(result):
+    if isinstance(result, pd.DataFrame):
+        return {"rows": len(result), "columns": result.shape[1]}
+    if isinstance(result, (bytes, bytearray)):
+        return {"bytes": len(result)}
+    if isinstance(result, (list, tuple)):
+        return {"items": len(result)}
+    return {}
+
+
+def _highlight_worksheet(cube):
+    """
+    在空工作表上添加“预测>0 且订单=0”条件格式，与渲染时的标红步骤相同。
+    """
+    ws = Workbook().active
+    n_sku, n_months, _ = cube.shape
+    apply_forecast_order_highlight(ws, n_months, n_sku)
+    return ws
+
+
+def run_benchmark(config, repeat=3, memory=True):
+    """
+    按阶段执行主计划流程并返回结果字典（可直接 json.dump）。
+    阶段：load_* → split_mapping → compile_mapping → extract_months → facts_* → assemble → highlight → render
+    """
+    frames = generate_inputs(**config)
+    contents = to_workbook_bytes(frames)
+    processor = PivotProcessor()
+    stages = []
+
+    def stage(name, func):
+        result, stats = _measure(func, repeat, memory)
+        stages.append({"stage": name, **stats, **_shape(result)})
+        return result
+
+    # 解析：绕过 ExcelCache，只测解析本身
+    loaded = {}
+    for key, content in contents.items():
+        sheet_name, header = INPUT_SPECS[key]
+        loaded[key] = stage(f"load_{key}", lambda content=content, sheet_name=sheet_name, header=header, key=key:
+                            read_excel_projected(content, sheet_name, header, REQUIRED_COLUMNS.get(key)))
+
+    _, mapping_new, mapping_sub = stage("split_mapping", lambda: split_mapping_data(loaded["mapping"]))
+    part_index = stage("compile_mapping", lambda: PartNumberIndex(mapping_new, mapping_sub))
+
+    stage("extract_months", lambda: extract_all_year_months(
+        loaded["forecast"].copy(), loaded["order"].copy(), loaded["sales"].copy()
+    ))
+
+    facts_list = [
+        stage(f"facts_{key}", lambda key=key: extract_source_facts(key, loaded[key], part_index))
+        for key in ("forecast", "order", "sales")
+    ]
+
+    cube = stage("assemble", lambda: processor.assemble_plan(loaded["template"], facts_list))
+    stage("highlight", lambda: _highlight_worksheet(cube))
+    stage("render", lambda: render_plan_excel(cube).getvalue())
+
+    return {
+        "config": config,
+        "repeat": repeat,
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "excel_engine": pick_engine(),
+            "machine": platform.machine(),
+        },
+        "input_bytes": {key: len(content) for key, content in contents.items()},
+        "plan_shape": list(cube.shape),
+        "stages": stages,
+        "total_seconds": sum(s["seconds"] for s in stages),
+    }
+
+
+def compare_results(current, baseline):
+    """
+    与历史结果逐阶段对比，返回 [(阶段, 基线秒数, 当前秒数, 倍率)]。
+    """
+    previous = {s["stage"]: s["seconds"] for s in baseline["stages"]}
+    rows = []
+    for s in current["stages"]:
+        before = previous.get(s["stage"])
+        ratio = s["seconds"] / before if before else None
+        rows.append((s["stage"], before, s["seconds"], ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="主计划流程分阶段基准测试")
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--order-rows", type=int, default=20000)
+    parser.add_argument("--sales-rows", type=int, default=50000)
+    parser.add_argument("--substitutes", type=int, default=2)
+    parser.add_argument("--mapped-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="不统计内存峰值")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON 结果输出路径")
+    parser.add_argument("--compare", help="用于对比的历史 JSON 结果")
+    args = parser.parse_args(argv)
+
+    config = {
+        "skus": args.skus,
+        "months": args.months,
+        "order_rows": args.order_rows,
+        "sales_rows": args.sales_rows,
+        "substitutes": args.substitutes,
+        "mapped_ratio": args.mapped_ratio,
+        "seed": args.seed,
+    }
+    result = run_benchmark(config, repeat=args.repeat, memory=not args.no_memory)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for s in result["stages"]:
+        peak = "" if s["peak_mb"] is None else f"  峰值 {s['peak_mb']:.1f} MB"
+        print(f"{s['stage']:<20}{s['seconds']:>10.4f} s{peak}")
+    print(f"{'total':<20}{result['total_seconds']:>10.4f} s  → {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n与基线对比：")
+        for name, before, after, ratio in compare_results(result, baseline):
+            change = "—" if ratio is None else f"{ratio:.2f}x"
+            before_text = "—" if before is None else f"{before:.4f}"
+            print(f"{name:<20}{before_text:>10} → {after:.4f} s  {change}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from github_utils import INPUT_SPECS, fetch_file_bytes, read_excel_bytes
+from instrumentation import submit_in_context
+
+# 下载线程数（网络 I/O）与解析进程数（CPU 密集的 xlsx 解析）上限
+FETCH_WORKERS = 5
+PARSE_WORKERS = min(5, os.cpu_count() or 1)
+# 解析进程的启动方式：页面服务进程是多线程的，fork 会复制其他线程持有的锁，
+# 因此用 forkserver（不支持时用 spawn），解析进程由干净的服务进程派生
+PARSE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+class InputLoadError(ValueError):
+    """
+    一个或多个输入文件加载失败；errors 为 {file_key: 错误信息}。
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        lines = "\n".join(f"- {key}: {message}" for key, message in errors.items())
+        super().__init__(f"❌ 以下文件加载失败：\n{lines}")
+
+
+def fetch_inputs_concurrently(uploaded_files, file_keys=None):
+    """
+    多线程获取各输入文件内容（上传文件直接读取，未上传的并发从 GitHub 下载）。
+
+    返回：
+        contents: {file_key: bytes}
+        errors: {file_key: 错误信息}
+    """
+    file_keys = list(file_keys or INPUT_SPECS)
+    contents, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        futures = {
+            key: submit_in_context(pool, fetch_file_bytes, key, uploaded_files.get(key))
+            for key in file_keys
+        }
+        for key, future in futures.items():
+            try:
+                contents[key] = future.result()
+            except Exception as e:
+                errors[key] = str(e)
+    return contents, errors
+
+
+def _parse_job(file_key, content):
+    sheet_name, header = INPUT_SPECS[file_key]
+    return read_excel_bytes(content, sheet_name=sheet_name, header=header, file_key=file_key)
+
+
+def _get_parse_pool():
+    """
+    进程内共用一个长期存在的解析进程池，首次使用时创建，之后各次请求复用已启动的进程。
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            context = multiprocessing.get_context(PARSE_START_METHOD)
+            if PARSE_START_METHOD == "forkserver":
+                # 预先在 forkserver 中导入解析依赖（pandas / openpyxl），新进程无需重复导入
+                context.set_forkserver_preload([__name__])
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=context)
+        return _parse_pool
+
+
+def _discard_parse_pool(pool):
+    """
+    进程池损坏（子进程异常退出）时丢弃，下次使用时重新创建。
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _collect(futures, frames, errors):
+    for key, future in futures.items():
+        try:
+            frames[key] = future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            errors[key] = str(e)
+
+
+def parse_inputs_concurrently(contents, use_processes=True):
+    """
+    多进程并行解析各输入文件（绕开 GIL），使用进程内共用的解析进程池；
+    进程池不可用时退回线程池。
+
+    返回：
+        frames: {file_key: DataFrame}
+        errors: {file_key: 错误信息}
+    """
+    frames, errors = {}, {}
+    if not contents:
+        return frames, errors
+
+    if use_processes and len(contents) > 1:
+        pool = None
+        try:
+            pool = _get_parse_pool()
+            futures = {key: pool.submit(_parse_job, key, content) for key, content in contents.items()}
+            _collect(futures, frames, errors)
+            return frames, errors
+        except (BrokenProcessPool, OSError, NotImplementedError, RuntimeError):
+            if pool is not None:
+                _discard_parse_pool(pool)
+            frames, errors = {}, {}
+
+    with ThreadPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        futures = {key: submit_in_context(pool, _parse_job, key, content) for key, content in contents.items()}
+        _collect(futures, frames, errors)
+    return frames, errors
+
+
+def load_inputs_concurrently(uploaded_files, file_keys=None, use_processes=True):
+    """
+    并发获取并解析全部输入文件，总耗时约等于最慢的单个文件。
+    任一文件失败时抛出 InputLoadError，列出每个失败文件的原因。
+
+    返回：
+        contents: {file_key: bytes}
+        frames: {file_key: DataFrame}
+    """
+    contents, errors = fetch_inputs_concurrently(uploaded_files, file_keys)
+    frames, parse_errors = parse_inputs_concurrently(contents, use_processes=use_processes)
+    errors.update(parse_errors)
+    if errors:
+        raise InputLoadError(errors)
+    return contents, frames
@@ -0,0 +1,218 @@
+import base64
+import hashlib
+import os
+import pickle
+import threading
+from excel_reader import read_excel_projected
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 未安装时退化为 pickle 存储
+    pa = None
+    pq = None
+
+# 缓存配置
+CACHE_DIR = os.environ.get(
+    "FORECAST_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+EXCEL_CACHE_MAX_BYTES = int(os.environ.get("FORECAST_EXCEL_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+_COLUMNS_META_KEY = b"forecast_analysis.columns"
+
+
+def content_hash(content: bytes) -> str:
+    """
+    文件内容的 sha256 摘要，作为缓存与指纹的基础。
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def read_uploaded_bytes(file_obj) -> bytes:
+    """
+    读取 Streamlit UploadedFile / 文件对象 / bytes 的全部内容（不改变读指针位置）。
+    """
+    if isinstance(file_obj, (bytes, bytearray)):
+        return bytes(file_obj)
+    if hasattr(file_obj, "getvalue"):
+        return file_obj.getvalue()
+    file_obj.seek(0)
+    content = file_obj.read()
+    file_obj.seek(0)
+    return content
+
+
+class ExcelCache:
+    """
+    已解析 Excel 的本地磁盘缓存。
+
+    - 键：文件内容 sha256 + sheet_name + header + usecols
+    - 值：解析后的 DataFrame，优先存 Parquet（读取时 memory-map），
+      Arrow 无法表示的混合类型列则退化为 pickle
+    - 淘汰：总大小超过 max_bytes 时按最近访问时间（文件 mtime）做 LRU 淘汰
+    - 统计：hits / misses 计数
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=EXCEL_CACHE_MAX_BYTES):
+        self.cache_dir = os.path.join(cache_dir or CACHE_DIR, "excel")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, content, sheet_name=0, header=0, usecols=None):
+        parts = [
+            content_hash(content),
+            repr(sheet_name),
+            repr(header),
+            repr(sorted(map(str, usecols)) if usecols is not None else None),
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".parquet", base + ".pkl"
+
+    def get(self, key):
+        """
+        命中返回 DataFrame，未命中返回 None。
+        """
+        for path in self._paths(key):
+            if not os.path.exists(path):
+                continue
+            try:
+                df = self._read(path)
+            except Exception:
+                # 损坏的缓存文件直接丢弃
+                self._remove(path)
+                continue
+            os.utime(path)  # 刷新访问时间，供 LRU 使用
+            with self._lock:
+                self.hits += 1
+            return df
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, df):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        parquet_path, pickle_path = self._paths(key)
+
+        path = parquet_path
+        try:
+            payload = self._to_parquet_bytes(df)
+        except Exception:
+            path = pickle_path
+            payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        self._evict()
+
+    def read_excel(self, content, sheet_name=0, header=0, usecols=None, parser=None):
+        """
+        带缓存的 Excel 解析：命中直接读缓存，否则用 parser（默认 read_excel_projected）解析后写入缓存。
+        usecols 可包含列名或正则，作为缓存键的一部分。
+        """
+        key = self.make_key(content, sheet_name, header, usecols)
+        df = self.get(key)
+        if df is not None:
+            return df
+
+        parser = parser or read_excel_projected
+        df = parser(content, sheet_name=sheet_name, header=header, usecols=usecols)
+
+        try:
+            self.put(key, df)
+        except OSError:
+            # 缓存目录不可写时不影响主流程
+            pass
+        return df
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            self._remove(path)
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith((".parquet", ".pkl")):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _to_parquet_bytes(df):
+        if pa is None:
+            raise RuntimeError("pyarrow 未安装")
+
+        # Parquet 只接受字符串列名：按位置重命名，原列名（可能是数字/日期）写入元数据
+        renamed = df.copy(deep=False)
+        renamed.columns = [f"c{i}" for i in range(df.shape[1])]
+        table = pa.Table.from_pandas(renamed, preserve_index=False)
+
+        columns_meta = base64.b64encode(pickle.dumps(list(df.columns)))
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            _COLUMNS_META_KEY: columns_meta,
+        })
+
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink)
+        return sink.getvalue().to_pybytes()
+
+    @staticmethod
+    def _read(path):
+        if path.endswith(".pkl"):
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+        table = pq.read_table(path, memory_map=True)
+        columns = pickle.loads(base64.b64decode(table.schema.metadata[_COLUMNS_META_KEY]))
+        df = table.to_pandas()
+        df.columns = columns
+        return df
+
+
+default_cache = ExcelCache()
@@ -0,0 +1,71 @@
+import re
+from io import BytesIO
+import pandas as pd
+
+try:
+    import python_calamine  # noqa: F401  仅用于检测 calamine 引擎是否可用
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+# 各输入文件实际用到的列：字符串为精确列名，正则为列名模式；None 表示读取全部列
+REQUIRED_COLUMNS = {
+    "template": ["晶圆", "规格", "品名"],
+    "forecast": ["生产料号", re.compile(r"\d{1,2}月预测")],
+    "order": ["品名", "客户要求交期", "订单数量"],
+    "sales": ["品名", "交易日期", "数量"],
+    "mapping": None,
+}
+
+
+def pick_engine(preferred=None):
+    """
+    选择解析引擎：显式指定优先；否则 calamine 可用时用 calamine，不可用时退回 openpyxl。
+    """
+    if preferred is not None:
+        return preferred
+    return "calamine" if HAS_CALAMINE else "openpyxl"
+
+
+def probe_columns(content, sheet_name=0, header=0, engine=None):
+    """
+    只读表头（nrows=0），返回列名列表。
+    """
+    return list(
+        pd.read_excel(BytesIO(content), sheet_name=sheet_name, header=header, nrows=0, engine=pick_engine(engine)).columns
+    )
+
+
+def select_columns(columns, required):
+    """
+    按 required（列名 / 正则）在表头中挑出需要的列，返回列位置列表（保持原顺序）。
+    """
+    positions = []
+    for i, col in enumerate(columns):
+        name = str(col).strip()
+        for spec in required:
+            if (spec.match(name) if isinstance(spec, re.Pattern) else name == spec):
+                positions.append(i)
+                break
+    return positions
+
+
+def read_excel_projected(content, sheet_name=0, header=0, usecols=None, engine=None):
+    """
+    解析 Excel 内容。
+
+    - usecols 为 None 时读取全部列
+    - 否则先探测表头，只投影 usecols（列名 / 正则）命中的列；一列都未命中时读取全部列，
+      交由下游按原逻辑报缺列错误
+    - calamine 解析失败时自动退回 openpyxl
+    """
+    engine = pick_engine(engine)
+    try:
+        positions = None
+        if usecols is not None:
+            positions = select_columns(probe_columns(content, sheet_name, header, engine), usecols) or None
+        return pd.read_excel(BytesIO(content), sheet_name=sheet_name, header=header, usecols=positions, engine=engine)
+    except Exception:
+        if engine == "openpyxl":
+            raise
+        return read_excel_projected(content, sheet_name, header, usecols, engine="openpyxl")
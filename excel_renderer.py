@@ -0,0 +1,275 @@
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+from info_extract import PLAN_METRICS
+from instrumentation import traced
+from plan_cube import BASE_COLUMNS
+
+PLAN_SHEET_NAME = "预测分析"
+
+# 每月三列表头的轮换底色
+MONTH_FILL_COLORS = [
+    "FFF2CC",  # 浅黄色
+    "D9EAD3",  # 浅绿色
+    "D0E0E3",  # 浅蓝色
+    "F4CCCC",  # 浅红色
+    "EAD1DC",  # 浅紫色
+    "CFE2F3",  # 浅青色
+    "FFE599",  # 明亮黄
+]
+
+HIGHLIGHT_COLOR = "FFC7CE"
+
+# 列宽：内容显示宽度 + 留白，上限 MAX_COLUMN_WIDTH；去重后超过 WIDTH_SAMPLE_ROWS 的文本列抽样估算
+WIDTH_PADDING = 4
+MAX_COLUMN_WIDTH = 60
+WIDTH_SAMPLE_ROWS = 10000
+
+# 全角 / 中日韩字符（显示宽度按 2 计）
+_WIDE_CHAR_PATTERN = (
+    "[\u1100-\u115F\u2E80-\u303E\u3041-\u33FF\u3400-\u4DBF\u4E00-\u9FFF"
+    "\uA000-\uA4CF\uAC00-\uD7A3\uF900-\uFAFF\uFE30-\uFE4F\uFF00-\uFF60\uFFE0-\uFFE6]"
+)
+
+# 数据单元格数超过该值时默认使用流式渲染
+STREAMING_CELL_THRESHOLD = 200_000
+
+
+def _month_fill(i):
+    color = MONTH_FILL_COLORS[i % len(MONTH_FILL_COLORS)]
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+def _header_alignment():
+    return Alignment(horizontal="center", vertical="center")
+
+
+def text_display_width(values):
+    """
+    字符串在 Excel 中的显示宽度（向量化）：全角 / 中日韩字符按 2 计，其余按 1 计。
+    """
+    values = values.astype(str)
+    return values.str.len() + values.str.count(_WIDE_CHAR_PATTERN)
+
+
+def _number_display_width(max_value, min_value):
+    lengths = [len(str(float(v))) for v in (max_value, min_value) if pd.notna(v) and v != 0]
+    return max(lengths, default=0)
+
+
+def _text_column_width(values, sample_rows):
+    """
+    文本列宽：先去重；去重后仍超过 sample_rows 时随机抽样并取 99 分位，避免逐值计算与个别超长值撑宽。
+    """
+    values = pd.Series(values).dropna()
+    values = values[values.astype(str) != ""].drop_duplicates()
+    if values.empty:
+        return 0
+    if len(values) > sample_rows:
+        widths = text_display_width(values.sample(sample_rows, random_state=0))
+        return int(np.ceil(np.percentile(widths, 99)))
+    return int(text_display_width(values).max())
+
+
+def _finalize_widths(content_widths, padding):
+    return [min(width + padding, MAX_COLUMN_WIDTH) for width in content_widths]
+
+
+def compute_column_widths(frame, header_labels=None, padding=WIDTH_PADDING, sample_rows=WIDTH_SAMPLE_ROWS):
+    """
+    按 DataFrame 的数据统计计算每列列宽（任意渲染器可复用）：
+    - 数值列：由列最大 / 最小值的格式化长度得出
+    - 文本列：向量化计算显示宽度，超大列抽样取分位
+    header_labels: 每列对应的表头文字列表（可多行），默认取列名
+    """
+    if header_labels is None:
+        header_labels = [[col] for col in frame.columns]
+
+    content_widths = []
+    for i, col in enumerate(frame.columns):
+        series = frame.iloc[:, i]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            data_width = _number_display_width(series.max(), series.min()) if len(series) else 0
+        else:
+            data_width = _text_column_width(series, sample_rows)
+        header_width = int(text_display_width(pd.Series(header_labels[i], dtype=object)).max()) if header_labels[i] else 0
+        content_widths.append(max(data_width, header_width))
+    return _finalize_widths(content_widths, padding)
+
+
+@traced()
+def plan_column_widths(cube, padding=WIDTH_PADDING, sample_rows=WIDTH_SAMPLE_ROWS):
+    """
+    主计划列宽：基本字段按文本统计，月份列直接对数组按列求最大 / 最小值，无需构建宽表。
+    """
+    content_widths = []
+    for label in BASE_COLUMNS:
+        data_width = _text_column_width(cube.base_df[label], sample_rows)
+        content_widths.append(max(data_width, int(text_display_width(pd.Series([label])).iloc[0])))
+
+    n_sku, n_months, n_metrics = cube.values.shape
+    flat = cube.values.reshape(n_sku, n_months * n_metrics)
+    col_max = flat.max(axis=0) if n_sku else np.zeros(flat.shape[1])
+    col_min = flat.min(axis=0) if n_sku else np.zeros(flat.shape[1])
+    metric_widths = text_display_width(pd.Series(PLAN_METRICS)).tolist()
+    for i in range(flat.shape[1]):
+        month_idx, metric_idx = divmod(i, n_metrics)
+        header_width = metric_widths[metric_idx]
+        if metric_idx == 0:
+            header_width = max(header_width, len(cube.months[month_idx]))
+        content_widths.append(max(_number_display_width(col_max[i], col_min[i]), header_width))
+    return _finalize_widths(content_widths, padding)
+
+
+def set_column_widths(ws, widths):
+    for col_idx, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+
+@traced()
+def apply_forecast_order_highlight(ws, n_months, n_rows, first_row=3):
+    """
+    为每个月的“预测 / 订单”两列添加一条条件格式：预测>0 且订单=0 时两格标红。
+    规则按整列区域生效，与行数无关，不逐格设置样式。
+    """
+    if n_rows <= 0:
+        return
+
+    red_fill = PatternFill(start_color=HIGHLIGHT_COLOR, end_color=HIGHLIGHT_COLOR, fill_type="solid")
+    last_row = first_row + n_rows - 1
+    n_base = len(BASE_COLUMNS)
+    n_metrics = len(PLAN_METRICS)
+    for m in range(n_months):
+        forecast_col = get_column_letter(n_base + 1 + m * n_metrics + PLAN_METRICS.index("预测"))
+        order_col = get_column_letter(n_base + 1 + m * n_metrics + PLAN_METRICS.index("订单"))
+        ws.conditional_formatting.add(
+            f"{forecast_col}{first_row}:{order_col}{last_row}",
+            FormulaRule(formula=[f"AND(${forecast_col}{first_row}>0,${order_col}{first_row}=0)"], fill=red_fill)
+        )
+
+
+def render_plan_excel(cube, streaming=None):
+    """
+    渲染主计划 Excel，返回 BytesIO。
+    streaming 为 None 时按数据量自动选择：超过 STREAMING_CELL_THRESHOLD 个数据单元格使用流式渲染。
+    """
+    if streaming is None:
+        streaming = cube.values.size > STREAMING_CELL_THRESHOLD
+    if streaming:
+        return render_plan_workbook_streaming(cube)
+    return render_plan_workbook(cube)
+
+
+@traced()
+def render_plan_workbook(cube):
+    """
+    常规渲染：to_excel 写入完整 openpyxl 工作簿后再设置表头、配色、条件格式高亮与列宽。
+    """
+    main_df = cube.to_frame()
+    all_months = list(cube.months)
+
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        main_df.to_excel(writer, index=False, sheet_name=PLAN_SHEET_NAME, startrow=1)
+        ws = writer.sheets[PLAN_SHEET_NAME]
+
+        apply_forecast_order_highlight(ws, len(all_months), len(main_df))
+
+        # === 设置基本字段（三列）合并行 ===
+        for i, label in enumerate(BASE_COLUMNS, start=1):
+            ws.merge_cells(start_row=1, start_column=i, end_row=2, end_column=i)
+            cell = ws.cell(row=1, column=i)
+            cell.value = label
+            cell.alignment = _header_alignment()
+            cell.font = Font(bold=True)
+
+        # === 合并每月三列，并设置标题 ===
+        col = len(BASE_COLUMNS) + 1
+        for i, ym in enumerate(all_months):
+            ws.merge_cells(start_row=1, start_column=col, end_row=1, end_column=col + 2)
+            top_cell = ws.cell(row=1, column=col)
+            top_cell.value = ym
+            top_cell.alignment = _header_alignment()
+            top_cell.font = Font(bold=True)
+
+            # 设置底部三列
+            for j, metric in enumerate(PLAN_METRICS):
+                ws.cell(row=2, column=col + j).value = metric
+
+            # 应用颜色样式
+            fill = _month_fill(i)
+            for j in range(col, col + 3):
+                ws.cell(row=1, column=j).fill = fill
+                ws.cell(row=2, column=j).fill = fill
+
+            col += 3
+
+        # === 自动列宽调整（由数据统计得出，不遍历单元格） ===
+        set_column_widths(ws, plan_column_widths(cube))
+
+    output.seek(0)
+    return output
+
+
+@traced()
+def render_plan_workbook_streaming(cube):
+    """
+    流式渲染：openpyxl write_only 模式一次顺序写出双行表头、月份配色、条件格式与数据行，
+    不在内存中保留单元格对象，效果与 render_plan_workbook 一致。
+    """
+    n_sku, n_months, n_metrics = cube.values.shape
+    n_base = len(BASE_COLUMNS)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(PLAN_SHEET_NAME)
+
+    # 列宽、合并区域须在写入数据行之前设置
+    set_column_widths(ws, plan_column_widths(cube))
+    for i in range(1, n_base + 1):
+        letter = get_column_letter(i)
+        ws.merged_cells.add(f"{letter}1:{letter}2")
+    for i in range(n_months):
+        start = n_base + 1 + i * n_metrics
+        ws.merged_cells.add(f"{get_column_letter(start)}1:{get_column_letter(start + n_metrics - 1)}1")
+
+    bold = Font(bold=True)
+    alignment = _header_alignment()
+    fills = [_month_fill(i) for i in range(len(MONTH_FILL_COLORS))]
+
+    def styled(value, font=None, fill=None, align=None):
+        cell = WriteOnlyCell(ws, value=value)
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if align is not None:
+            cell.alignment = align
+        return cell
+
+    # 第 1 行：基本字段 + 月份（合并三列）
+    top_row = [styled(label, bold, align=alignment) for label in BASE_COLUMNS]
+    sub_row = [None] * n_base
+    for i, ym in enumerate(cube.months):
+        fill = fills[i % len(fills)]
+        top_row.append(styled(ym, bold, fill, alignment))
+        top_row.extend(styled(None, fill=fill) for _ in range(n_metrics - 1))
+        sub_row.extend(styled(metric, fill=fill) for metric in PLAN_METRICS)
+    ws.append(top_row)
+    ws.append(sub_row)
+
+    # 预测>0 且订单=0 标红：条件格式，写行时无需逐格设置样式
+    apply_forecast_order_highlight(ws, n_months, n_sku)
+
+    # 数据行：逐行转换为 Python 值后写出，不为整个计划构建中间列表
+    for r, base in enumerate(cube.base_df.itertuples(index=False, name=None)):
+        ws.append([None if pd.isna(v) else v for v in base] + cube.values[r].ravel().tolist())
+
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
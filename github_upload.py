@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from github_utils import GitHubUploadError, git_blob_sha, upload_bytes
+
+# 失败重试次数与指数退避基数（秒）；4xx 中只有冲突类状态码值得重试
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 1.0
+UPLOAD_RETRY_STATUS = {409, 422, 429, 500, 502, 503, 504}
+
+# 状态：queued → uploading → uploaded / unchanged / failed
+UPLOAD_PENDING_STATES = ("queued", "uploading")
+
+
+class UploadQueue:
+    """
+    后台上传队列：页面提交后立即返回，文件在单个后台线程中依次上传至 GitHub。
+
+    - 单线程执行：同一分支上的提交按顺序进行，避免互相覆盖
+    - 去重：本地计算 git blob sha，与上次成功上传 / 远端一致时跳过
+    - 同一提交方的同一文件排队期间再次提交只上传最新内容
+    - 网络错误、冲突及 429/5xx 按指数退避重试
+    - 状态按提交方（owner，如页面会话 id）分开记录，statuses(owner) 只返回该提交方的上传
+    """
+
+    def __init__(self, retries=UPLOAD_RETRIES, backoff=UPLOAD_BACKOFF, upload=upload_bytes):
+        self.retries = retries
+        self.backoff = backoff
+        self._upload = upload
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="github-upload")
+        self._pending = {}
+        self._synced = {}
+        self._status = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _set_status(self, job, state, **fields):
+        with self._lock:
+            entry = self._status.setdefault(job, {"filename": job[1]})
+            entry.update(state=state, updated=time.time(), **fields)
+
+    def submit(self, filename, content, owner=None):
+        """
+        提交上传（非阻塞），返回本地 blob sha。
+        """
+        job = (owner, filename)
+        sha = git_blob_sha(content)
+        with self._lock:
+            queued = job in self._pending
+            if self._synced.get(filename) == sha and not queued:
+                self._status[job] = {"filename": filename, "state": "unchanged", "updated": time.time(),
+                                     "sha": sha, "size": len(content), "attempts": 0, "error": None}
+                return sha
+            self._pending[job] = content
+        self._set_status(job, "queued", sha=sha, size=len(content), attempts=0, error=None)
+        if not queued:
+            self._pool.submit(self._run, job)
+        return sha
+
+    def _run(self, job):
+        filename = job[1]
+        with self._lock:
+            content = self._pending.pop(job)
+
+        for attempt in range(1, self.retries + 2):
+            self._set_status(job, "uploading", attempts=attempt)
+            try:
+                state, sha = self._upload(content, filename)
+            except (GitHubUploadError, requests.RequestException) as e:
+                retriable = getattr(e, "status_code", None) in UPLOAD_RETRY_STATUS or not isinstance(e, GitHubUploadError)
+                if retriable and attempt <= self.retries:
+                    self._set_status(job, "uploading", error=str(e))
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                self._set_status(job, "failed", error=str(e))
+                return
+            except Exception as e:
+                self._set_status(job, "failed", error=str(e))
+                return
+
+            with self._lock:
+                self._synced[filename] = sha
+            self._set_status(job, state, sha=sha, error=None)
+            return
+
+    def statuses(self, owner=None):
+        """
+        某一提交方各文件最近一次上传的状态列表（按首次提交顺序）。
+        """
+        with self._lock:
+            return [dict(entry) for (job_owner, _), entry in self._status.items() if job_owner == owner]
+
+    def pending(self, owner=None):
+        return any(entry["state"] in UPLOAD_PENDING_STATES for entry in self.statuses(owner))
+
+    def wait(self, owner=None, timeout=None):
+        """
+        等待某一提交方已提交的上传全部结束，超时返回 False。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending(owner):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+default_uploader = UploadQueue()
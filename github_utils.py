@@ -1,12 +1,16 @@
-from io import BytesIO
 import base64
-import requests
-import streamlit as st
-import pandas as pd
+import hashlib
+import os
+import posixpath
 from urllib.parse import quote
+from excel_cache import default_cache, read_uploaded_bytes
+from excel_reader import REQUIRED_COLUMNS
+from http_client import GITHUB_API_BASE, GITHUB_RAW_BASE, default_client
+from instrumentation import trace_span
+from streamlit_compat import get_secret
 
 # GitHub 配置
-GITHUB_TOKEN_KEY = "GITHUB_TOKEN"  # secrets.toml 中的密钥名
+GITHUB_TOKEN_KEY = "GITHUB_TOKEN"  # secrets.toml 中的密钥名（也可用同名环境变量）
 REPO_NAME = "TTTriste06/Forecast-Analysis"
 BRANCH = "main"
 
@@ -17,56 +21,146 @@ FILENAME_KEYS = {
     "template": "预测分析.xlsx"
 }
 
-def upload_to_github(file_obj, filename):
+# 超过该大小的文件改用 Git Data API（blob → tree → commit → ref）上传
+UPLOAD_BLOB_THRESHOLD = int(float(os.environ.get("FORECAST_UPLOAD_BLOB_MB", "1")) * 1024 * 1024)
+
+
+class GitHubUploadError(ValueError):
     """
-    将 file_obj 文件上传至 GitHub 指定仓库
+    上传失败；status_code 为 GitHub 返回的 HTTP 状态码（网络错误时为 None）。
     """
-    token = st.secrets[GITHUB_TOKEN_KEY]
-    safe_filename = quote(filename)  # 支持中文
 
-    url = f"https://api.github.com/repos/{REPO_NAME}/contents/{safe_filename}"
-    headers = {
-        "Authorization": f"token {token}",
+    def __init__(self, message, status_code=None):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def git_blob_sha(content: bytes) -> str:
+    """
+    本地计算 git blob sha（sha1("blob <长度>\\0" + 内容)），与 GitHub 返回的文件 sha 一致。
+    """
+    header = f"blob {len(content)}\0".encode("utf-8")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+def _github_headers():
+    return {
+        "Authorization": f"token {get_secret(GITHUB_TOKEN_KEY)}",
         "Accept": "application/vnd.github.v3+json"
     }
 
-    file_obj.seek(0)
-    content = base64.b64encode(file_obj.read()).decode("utf-8")
-    file_obj.seek(0)
 
-    # 检查是否已存在
-    sha = None
-    get_resp = requests.get(url, headers=headers)
-    if get_resp.status_code == 200:
-        sha = get_resp.json().get("sha")
+def _repo_url(path):
+    return f"{GITHUB_API_BASE}/repos/{REPO_NAME}/{path}"
 
+
+def _check(response, action):
+    if response.status_code not in [200, 201]:
+        raise GitHubUploadError(f"❌ {action}失败：{response.status_code} - {response.text}", response.status_code)
+    return response.json()
+
+
+def remote_blob_sha(filename, headers=None):
+    """
+    读取仓库中文件当前的 blob sha（不存在时返回 None）。
+    通过列出所在目录获取，只返回元数据，不下载文件内容。
+    """
+    headers = headers or _github_headers()
+    parent, name = posixpath.split(filename)
+    response = default_client.get(
+        _repo_url(f"contents/{quote(parent)}").rstrip("/"), headers=headers, params={"ref": BRANCH}
+    )
+    if response.status_code == 404:
+        return None
+    entries = _check(response, "读取远端文件列表")
+    return next((e["sha"] for e in entries if e.get("name") == name and e.get("type") == "file"), None)
+
+
+def _put_contents(content, filename, remote_sha, message, headers):
     payload = {
-        "message": f"upload {filename}",
-        "content": content,
+        "message": message,
+        "content": base64.b64encode(content).decode("utf-8"),
         "branch": BRANCH
     }
-    if sha:
-        payload["sha"] = sha
+    if remote_sha:
+        payload["sha"] = remote_sha
+
+    put_resp = default_client.put(_repo_url(f"contents/{quote(filename)}"), headers=headers, json=payload)
+    return _check(put_resp, "上传")["content"]["sha"]
+
+
+def _commit_blob(content, filename, message, headers):
+    """
+    大文件：先创建 blob，再基于分支最新提交建 tree / commit 并移动分支指针。
+    """
+    blob = _check(default_client.post(_repo_url("git/blobs"), headers=headers, json={
+        "content": base64.b64encode(content).decode("utf-8"),
+        "encoding": "base64"
+    }), "创建 blob")
+
+    ref = _check(default_client.get(_repo_url(f"git/ref/heads/{BRANCH}"), headers=headers), "读取分支")
+    parent_sha = ref["object"]["sha"]
+    parent = _check(default_client.get(_repo_url(f"git/commits/{parent_sha}"), headers=headers), "读取提交")
+
+    tree = _check(default_client.post(_repo_url("git/trees"), headers=headers, json={
+        "base_tree": parent["tree"]["sha"],
+        "tree": [{"path": filename, "mode": "100644", "type": "blob", "sha": blob["sha"]}]
+    }), "创建 tree")
+    commit = _check(default_client.post(_repo_url("git/commits"), headers=headers, json={
+        "message": message,
+        "tree": tree["sha"],
+        "parents": [parent_sha]
+    }), "创建提交")
+    # 非快进（分支已被他人更新）时 GitHub 返回 422，由调用方重试
+    _check(default_client.patch(_repo_url(f"git/refs/heads/{BRANCH}"), headers=headers, json={
+        "sha": commit["sha"]
+    }), "更新分支")
+    return blob["sha"]
+
+
+def upload_bytes(content, filename, message=None):
+    """
+    上传文件内容至 GitHub 仓库，返回 (状态, blob sha)：
+    - 远端内容相同（blob sha 一致）时不上传，状态为 "unchanged"
+    - 小文件走 contents API，超过 UPLOAD_BLOB_THRESHOLD 的走 Git Data API，状态为 "uploaded"
+    """
+    headers = _github_headers()
+    local_sha = git_blob_sha(content)
+    remote_sha = remote_blob_sha(filename, headers)
+    if remote_sha == local_sha:
+        return "unchanged", local_sha
+
+    message = message or f"upload {filename}"
+    if len(content) > UPLOAD_BLOB_THRESHOLD:
+        sha = _commit_blob(content, filename, message, headers)
+    else:
+        sha = _put_contents(content, filename, remote_sha, message, headers)
+    if sha != local_sha:
+        raise GitHubUploadError(f"❌ 上传校验失败：{filename} 远端 sha {sha} 与本地 {local_sha} 不一致")
+    return "uploaded", sha
+
 
-    put_resp = requests.put(url, headers=headers, json=payload)
-    if put_resp.status_code not in [200, 201]:
-        raise Exception(f"❌ 上传失败：{put_resp.status_code} - {put_resp.text}")
+def upload_to_github(file_obj, filename):
+    """
+    将 file_obj 文件上传至 GitHub 指定仓库（同步；页面中请使用 github_upload.default_uploader）
+    """
+    return upload_bytes(read_uploaded_bytes(file_obj), filename)
 
 
 def download_from_github(filename):
     """
     从 GitHub 下载文件内容（二进制返回）
     """
-    token = st.secrets[GITHUB_TOKEN_KEY]
+    token = get_secret(GITHUB_TOKEN_KEY)
     safe_filename = quote(filename)
 
-    url = f"https://api.github.com/repos/{REPO_NAME}/contents/{safe_filename}?ref={BRANCH}"
+    url = f"{GITHUB_API_BASE}/repos/{REPO_NAME}/contents/{safe_filename}?ref={BRANCH}"
     headers = {
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
 
-    response = requests.get(url, headers=headers)
+    response = default_client.get(url, headers=headers)
     if response.status_code == 200:
         json_resp = response.json()
         return base64.b64decode(json_resp["content"])
@@ -74,29 +168,56 @@ def download_from_github(filename):
         raise FileNotFoundError(f"❌ GitHub 上找不到文件：{filename} (HTTP {response.status_code})")
 
 
-def load_file_with_github_fallback(file_key, uploaded_file, sheet_name=0, header=0):
-    fallback_urls = {
-        "template": "https://raw.githubusercontent.com/TTTriste06/forecast-analysis/main/预测分析.xlsx",
-        "forecast": "https://raw.githubusercontent.com/TTTriste06/forecast-analysis/main/预测.xlsx",
-        "order": "https://raw.githubusercontent.com/TTTriste06/forecast-analysis/main/未交订单.xlsx",
-        "sales": "https://raw.githubusercontent.com/TTTriste06/forecast-analysis/main/出货明细.xlsx",
-        "mapping": "https://raw.githubusercontent.com/TTTriste06/operation_planning-/main/新旧料号.xlsx"
-    }
+FALLBACK_URLS = {
+    "template": f"{GITHUB_RAW_BASE}/TTTriste06/forecast-analysis/main/预测分析.xlsx",
+    "forecast": f"{GITHUB_RAW_BASE}/TTTriste06/forecast-analysis/main/预测.xlsx",
+    "order": f"{GITHUB_RAW_BASE}/TTTriste06/forecast-analysis/main/未交订单.xlsx",
+    "sales": f"{GITHUB_RAW_BASE}/TTTriste06/forecast-analysis/main/出货明细.xlsx",
+    "mapping": f"{GITHUB_RAW_BASE}/TTTriste06/operation_planning-/main/新旧料号.xlsx"
+}
+
+# 各输入文件的读取参数：file_key → (sheet_name, header)
+INPUT_SPECS = {
+    "template": (0, 1),
+    "forecast": (0, 0),
+    "order": ("Sheet", 0),
+    "sales": ("原表", 0),
+    "mapping": (0, 0),
+}
 
+
+def fetch_file_bytes(file_key, uploaded_file=None):
+    """
+    获取文件原始内容：优先使用上传文件，否则从 GitHub fallback 地址下载。
+    """
     if uploaded_file is not None:
-        return pd.read_excel(uploaded_file, sheet_name=sheet_name, header=header, engine="openpyxl")
-    
+        with trace_span(f"fetch:{file_key}", source="upload"):
+            return read_uploaded_bytes(uploaded_file)
+
     # fallback 读取
-    if file_key not in fallback_urls:
+    if file_key not in FALLBACK_URLS:
         raise ValueError(f"⚠️ 未识别的辅助文件类型：{file_key}")
 
-    url = fallback_urls[file_key]
-    response = requests.get(url)
-    if not response.ok:
-        raise ValueError(f"❌ 无法从 GitHub 获取文件：{url}")
-    
-    content = response.content
+    # 条件请求：远端文件未变化时只需一次 304，直接使用本地缓存
+    with trace_span(f"fetch:{file_key}", source="github"):
+        return default_client.get_cached(FALLBACK_URLS[file_key])
+
+
+def read_excel_bytes(content, sheet_name=0, header=0, file_key=None):
+    """
+    解析 Excel 内容（经本地缓存，同一内容 + 参数只解析一次）。
+    指定 file_key 时只投影该文件在 REQUIRED_COLUMNS 中登记的列。
+    """
     try:
-        return pd.read_excel(BytesIO(content), sheet_name=sheet_name, header=header, engine="openpyxl")
+        with trace_span(f"parse:{file_key}", bytes=len(content)) as span:
+            return span.set_output(default_cache.read_excel(
+                content, sheet_name=sheet_name, header=header, usecols=REQUIRED_COLUMNS.get(file_key)
+            ))
     except Exception as e:
         raise ValueError(f"❌ 无法读取 Excel 文件（可能不是 .xlsx 格式）：{e}")
+
+
+def load_file_with_github_fallback(file_key, uploaded_file, sheet_name=0, header=0):
+    with trace_span(f"load:{file_key}") as span:
+        content = fetch_file_bytes(file_key, uploaded_file)
+        return span.set_output(read_excel_bytes(content, sheet_name=sheet_name, header=header, file_key=file_key))
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import pandas as pd
+from excel_cache import CACHE_DIR
+from excel_reader import read_excel_projected
+from info_extract import SOURCE_MELTERS, aggregate_facts, concat_facts, empty_facts, parse_dates
+from stream_ingest import iter_sheet_chunks, should_stream
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger("forecast_analysis")
+
+HISTORY_DIR = os.environ.get("FORECAST_HISTORY_DIR", os.path.join(CACHE_DIR, "history"))
+
+# 各数据源的历史明细字段：归月日期列、数量列、行键列（全部存在时按行键去重）
+# 未交订单是当前未交订单的快照，已出货的订单会从表中消失，不适合累积入库，因此只有出货明细
+HISTORY_SPECS = {
+    "sales": {"date": "交易日期", "qty": "数量", "keys": ["单号", "序号"]},
+}
+
+# 启用历史库的数据源（逗号分隔，如 "sales"）；启用后该数据源的汇总改为读取历史分区
+_REQUESTED_SOURCES = [
+    key.strip() for key in os.environ.get("FORECAST_HISTORY_SOURCES", "").split(",") if key.strip()
+]
+HISTORY_SOURCES = tuple(key for key in _REQUESTED_SOURCES if key in HISTORY_SPECS)
+if len(HISTORY_SOURCES) != len(_REQUESTED_SOURCES):
+    logger.warning(
+        "⚠️ FORECAST_HISTORY_SOURCES 中的 %s 不支持历史库，已忽略（可选 %s）",
+        [key for key in _REQUESTED_SOURCES if key not in HISTORY_SPECS], list(HISTORY_SPECS)
+    )
+
+
+# 入库锁：页面每次运行都会新建 HistoryStore，锁放在模块级，同一进程内的多个会话依次入库
+_INGEST_LOCK = threading.Lock()
+
+
+def _temp_path(path):
+    # 临时文件名带进程号与线程号，同一进程内的多个线程互不覆盖
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _write_json(path, data, **kwargs):
+    tmp_path = _temp_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def history_columns(file_key):
+    """
+    入库需要读取的列：品名、日期、数量及行键列。
+    """
+    spec = HISTORY_SPECS[file_key]
+    return ["品名", spec["date"], spec["qty"], *spec["keys"]]
+
+
+class HistoryStore:
+    """
+    出货明细的本地列式历史库，按年月分区（Parquet）：
+
+        {root}/{file_key}/{yyyy-mm}/rows.parquet   明细行（去重后）
+        {root}/{file_key}/{yyyy-mm}/agg.parquet    按原始品名预汇总的数量
+        {root}/{file_key}/manifest.json            {yyyy-mm: 分区内容摘要}
+
+    ingest 只重写新月份或内容有变化的月份，重复上传同一份文件不会产生重复数据：
+    - 有 单号 / 序号 时以其为行键，后上传的行覆盖先前的同键行（数量、日期更正生效，
+      日期改到其他月份时从原月份分区中移除）
+    - 没有行键时以全部字段 + 同值行的出现序号去重，保证真实的重复行不被误删
+    读取只访问所需月份的预汇总分区（memory-map）。
+    """
+
+    def __init__(self, root=None):
+        if pa is None:
+            raise ValueError("❌ 历史库需要安装 pyarrow")
+        self.root = root or HISTORY_DIR
+
+    def _source_dir(self, file_key):
+        return os.path.join(self.root, file_key)
+
+    def _partition_dir(self, file_key, month):
+        return os.path.join(self._source_dir(file_key), month)
+
+    def _manifest_path(self, file_key):
+        return os.path.join(self._source_dir(file_key), "manifest.json")
+
+    def manifest(self, file_key):
+        path = self._manifest_path(file_key)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, file_key, manifest):
+        os.makedirs(self._source_dir(file_key), exist_ok=True)
+        _write_json(self._manifest_path(file_key), dict(sorted(manifest.items())), indent=1)
+
+    def months(self, file_key):
+        return sorted(self.manifest(file_key))
+
+    def version(self, file_key, months=None):
+        """
+        历史库（指定月份范围内）的版本摘要，可作为增量重算的指纹。
+        """
+        manifest = self.manifest(file_key)
+        keys = sorted(manifest) if months is None else [m for m in sorted(manifest) if m in set(months)]
+        joined = "|".join(f"{m}={manifest[m]}" for m in keys)
+        return hashlib.sha256(f"{file_key}|{joined}".encode("utf-8")).hexdigest()
+
+    def _normalize_rows(self, file_key, df):
+        spec = HISTORY_SPECS[file_key]
+        keys = [col for col in spec["keys"] if col in df.columns]
+        rows = pd.DataFrame({
+            "品名": df["品名"].astype(str).str.strip(),
+            spec["date"]: parse_dates(df[spec["date"]], cache_key=f"{file_key}:{spec['date']}"),
+            spec["qty"]: pd.to_numeric(df[spec["qty"]], errors="coerce").fillna(0),
+        })
+        for col in keys:
+            rows[col] = df[col].astype(str).str.strip()
+        rows["年月"] = rows[spec["date"]].dt.strftime("%Y-%m")
+        rows = rows[rows["年月"].notna()]
+
+        if len(keys) == len(spec["keys"]):
+            # 行键完整：同一 单号 + 序号 只保留最后一次出现的版本
+            return rows.drop_duplicates(subset=keys, keep="last"), keys
+
+        # 无行键：全部字段 + 同值行的出现序号
+        key_cols = keys + ["品名", spec["date"], spec["qty"]]
+        rows["_occurrence"] = rows.groupby(key_cols, dropna=False).cumcount()
+        return rows, key_cols + ["_occurrence"]
+
+    def _moved_row_months(self, file_key, manifest, rows, key_cols):
+        """
+        行键模式下，本次上传的行键出现在其他月份分区中的月份（日期被更正，旧版本需移除）。
+        """
+        incoming = rows.set_index(key_cols)["年月"]
+        moved = set()
+        for month in manifest:
+            rows_path = os.path.join(self._partition_dir(file_key, month), "rows.parquet")
+            if not os.path.exists(rows_path):
+                continue
+            existing = pd.MultiIndex.from_frame(pq.read_table(rows_path, columns=key_cols).to_pandas())
+            new_months = incoming.reindex(existing).dropna()
+            if (new_months != month).any():
+                moved.add(month)
+        return moved
+
+    @staticmethod
+    def _partition_hash(rows, key_cols):
+        ordered = rows.sort_values(key_cols).reset_index(drop=True)
+        return hashlib.sha256(pd.util.hash_pandas_object(ordered, index=False).values.tobytes()).hexdigest()
+
+    def _ingested_path(self, file_key):
+        return os.path.join(self._source_dir(file_key), "ingested.json")
+
+    def is_ingested(self, file_key, source_digest):
+        path = self._ingested_path(file_key)
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            return source_digest in json.load(f)
+
+    def _mark_ingested(self, file_key, source_digest):
+        # 调用方持有 _INGEST_LOCK，读-改-写不会与其他入库交错
+        path = self._ingested_path(file_key)
+        digests = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                digests = json.load(f)
+        digests.append(source_digest)
+        os.makedirs(self._source_dir(file_key), exist_ok=True)
+        _write_json(path, digests)
+
+    def ingest(self, file_key, df, source_digest=None):
+        """
+        将一次上传的明细并入历史库，返回新增或变化的月份列表。
+        传入 source_digest（上传文件内容摘要）时，同一文件只入库一次。
+        """
+        rows, key_cols = self._normalize_rows(file_key, df)
+        keyed = "_occurrence" not in key_cols
+        changed = []
+        with _INGEST_LOCK:
+            # 在锁内判断，两个会话同时上传同一文件时只有一个入库
+            if source_digest is not None and self.is_ingested(file_key, source_digest):
+                return []
+            manifest = self.manifest(file_key)
+            by_month = {month: group.drop(columns="年月") for month, group in rows.groupby("年月", sort=True)}
+            months = set(by_month)
+            if keyed:
+                months |= self._moved_row_months(file_key, manifest, rows, key_cols)
+            incoming_keys = pd.MultiIndex.from_frame(rows[key_cols]) if keyed else None
+
+            for month in sorted(months):
+                month_rows = by_month.get(month, rows.iloc[:0].drop(columns="年月"))
+                partition_dir = self._partition_dir(file_key, month)
+                rows_path = os.path.join(partition_dir, "rows.parquet")
+
+                if month in manifest and os.path.exists(rows_path):
+                    existing = pq.read_table(rows_path, memory_map=True).to_pandas()
+                    if keyed:
+                        # 同键行以本次上传为准（含改到其他月份的行）
+                        existing = existing[~pd.MultiIndex.from_frame(existing[key_cols]).isin(incoming_keys)]
+                    merged = pd.concat([existing, month_rows], ignore_index=True)
+                    merged = merged.drop_duplicates(subset=key_cols, keep="last")
+                else:
+                    merged = month_rows.drop_duplicates(subset=key_cols, keep="last")
+
+                if merged.empty:
+                    shutil.rmtree(partition_dir, ignore_errors=True)
+                    manifest.pop(month, None)
+                    changed.append(month)
+                    continue
+
+                digest = self._partition_hash(merged, key_cols)
+                if manifest.get(month) == digest:
+                    continue
+
+                self._write_partition(file_key, month, merged)
+                manifest[month] = digest
+                changed.append(month)
+
+            if changed:
+                self._save_manifest(file_key, manifest)
+            if source_digest is not None:
+                self._mark_ingested(file_key, source_digest)
+        return changed
+
+    def ingest_content(self, file_key, content, sheet_name=0, header=0, source_digest=None):
+        """
+        由原始 Excel 内容入库：只读取 history_columns 列，大文件走流式读取。
+        """
+        if source_digest is not None and self.is_ingested(file_key, source_digest):
+            return []
+        if should_stream(file_key, content):
+            chunks = list(iter_sheet_chunks(content, sheet_name, header, history_columns(file_key)))
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=history_columns(file_key))
+        else:
+            df = read_excel_projected(content, sheet_name=sheet_name, header=header, usecols=history_columns(file_key))
+        return self.ingest(file_key, df, source_digest=source_digest)
+
+    def _write_partition(self, file_key, month, rows):
+        partition_dir = self._partition_dir(file_key, month)
+        tmp_dir = _temp_path(partition_dir)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        rows = rows.reset_index(drop=True)
+        pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), os.path.join(tmp_dir, "rows.parquet"))
+
+        # 预汇总：按原始品名汇总数量，读取时再做料号替换
+        agg = aggregate_facts(SOURCE_MELTERS[file_key](rows))
+        pq.write_table(pa.Table.from_pandas(agg, preserve_index=False), os.path.join(tmp_dir, "agg.parquet"))
+
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        os.replace(tmp_dir, partition_dir)
+
+    def read_facts(self, file_key, part_index=None, start=None, end=None):
+        """
+        读取 [start, end] 月份范围内的预汇总分区，返回（品名, 年月, 指标, 数量）汇总长表。
+        传入 part_index 时对品名做新旧料号替换后再汇总。
+        """
+        months = [
+            m for m in self.months(file_key)
+            if (start is None or m >= start) and (end is None or m <= end)
+        ]
+        frames = [
+            pq.read_table(os.path.join(self._partition_dir(file_key, m), "agg.parquet"), memory_map=True).to_pandas()
+            for m in months
+        ]
+        if not frames:
+            return empty_facts()
+
+        facts = concat_facts(frames)
+        if part_index is not None:
+            facts["品名"] = part_index.resolve(facts["品名"])
+            facts = facts[facts["品名"] != ""]
+        return aggregate_facts(facts)
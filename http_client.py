@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from excel_cache import CACHE_DIR
+
+# 远端地址（可通过环境变量指向本地替身服务器，便于测试）
+GITHUB_API_BASE = os.environ.get("GITHUB_API_BASE", "https://api.github.com").rstrip("/")
+GITHUB_RAW_BASE = os.environ.get("GITHUB_RAW_BASE", "https://raw.githubusercontent.com").rstrip("/")
+
+# (连接超时, 读取超时) 秒
+HTTP_TIMEOUT = (5, 60)
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 10
+
+
+class HttpClient:
+    """
+    共享 HTTP 客户端：
+    - requests.Session 连接池复用
+    - 默认超时，连接错误及 429/5xx 按指数退避重试
+    - get_cached：本地磁盘缓存 + ETag / If-None-Match 条件请求，远端未变化时只需一次 304
+    """
+
+    def __init__(self, cache_dir=None, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF,
+                 pool_size=HTTP_POOL_SIZE):
+        self.timeout = timeout
+        self.cache_dir = os.path.join(cache_dir or CACHE_DIR, "http")
+        self.revalidated = 0
+        self.downloaded = 0
+        self._lock = threading.Lock()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def _cache_paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".body", base + ".json"
+
+    def get_cached(self, url, headers=None):
+        """
+        条件 GET：本地有缓存时携带 If-None-Match / If-Modified-Since，304 直接返回缓存内容。
+        返回响应体 bytes；请求失败抛出 ValueError。
+        """
+        body_path, meta_path = self._cache_paths(url)
+        headers = dict(headers or {})
+
+        meta = None
+        if os.path.exists(body_path) and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.get(url, headers=headers)
+
+        if response.status_code == 304 and meta is not None:
+            with self._lock:
+                self.revalidated += 1
+            with open(body_path, "rb") as f:
+                return f.read()
+
+        if not response.ok:
+            raise ValueError(f"❌ 无法从 GitHub 获取文件：{url} (HTTP {response.status_code})")
+
+        with self._lock:
+            self.downloaded += 1
+        content = response.content
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._store(body_path, meta_path, url, content, etag, last_modified)
+        return content
+
+    def _store(self, body_path, meta_path, url, content, etag, last_modified):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(body_path + suffix, "wb") as f:
+                f.write(content)
+            os.replace(body_path + suffix, body_path)
+            with open(meta_path + suffix, "w", encoding="utf-8") as f:
+                json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
+            os.replace(meta_path + suffix, meta_path)
+        except OSError:
+            # 缓存目录不可写时不影响下载结果
+            pass
+
+    def stats(self):
+        return {"revalidated": self.revalidated, "downloaded": self.downloaded}
+
+
+default_client = HttpClient()
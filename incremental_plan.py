@@ -0,0 +1,167 @@
+import hashlib
+import os
+import pickle
+import threading
+import pandas as pd
+from excel_cache import CACHE_DIR
+from info_extract import FACT_SCHEMA_VERSION, SOURCE_METRICS, expand_month_range, fact_months
+from plan_cube import PlanCube
+
+# 每个数据源在磁盘上保留的汇总版本数
+AGGREGATE_VERSIONS_KEPT = 4
+
+
+def source_fingerprint(source_digest, mapping_digest):
+    """
+    单数据源汇总结果的指纹：源文件内容摘要 + 新旧料号表版本 + 事实表 dtype 版本。
+    """
+    return hashlib.sha256(f"{source_digest}|{mapping_digest}|v{FACT_SCHEMA_VERSION}".encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+class SourceAggregateStore:
+    """
+    按数据源持久化（品名, 年月, 指标, 数量）汇总长表，以 source_fingerprint 为键。
+    """
+
+    def __init__(self, cache_dir=None, versions_kept=AGGREGATE_VERSIONS_KEPT):
+        self.root = os.path.join(cache_dir or CACHE_DIR, "aggregates")
+        self.versions_kept = versions_kept
+
+    def _path(self, file_key, fingerprint):
+        return os.path.join(self.root, f"{file_key}-{fingerprint}.pkl")
+
+    def has(self, file_key, fingerprint):
+        return os.path.exists(self._path(file_key, fingerprint))
+
+    def load(self, file_key, fingerprint):
+        path = self._path(file_key, fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            facts = pd.read_pickle(path)
+        except Exception:
+            return None
+        os.utime(path)
+        return facts
+
+    def save(self, file_key, fingerprint, facts):
+        os.makedirs(self.root, exist_ok=True)
+        _atomic_write(self._path(file_key, fingerprint), pickle.dumps(facts, protocol=pickle.HIGHEST_PROTOCOL))
+        self._prune(file_key)
+
+    def get_or_compute(self, file_key, fingerprint, compute):
+        facts = self.load(file_key, fingerprint)
+        if facts is None:
+            facts = compute()
+            try:
+                self.save(file_key, fingerprint, facts)
+            except OSError:
+                pass
+        return facts
+
+    def _prune(self, file_key):
+        prefix = f"{file_key}-"
+        paths = [
+            os.path.join(self.root, name) for name in os.listdir(self.root)
+            if name.startswith(prefix) and name.endswith(".pkl")
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.versions_kept:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class IncrementalPlanner:
+    """
+    增量重算主计划。
+
+    以模板内容摘要为键保存上一次的 PlanCube、各数据源指纹及其涉及月份。
+    新一轮只重算指纹发生变化的数据源；若月份区间不变，则只把该数据源对应的指标
+    拼接回上一次的计划，其余指标原样保留；否则用各数据源已持久化的汇总结果整体重建。
+    """
+
+    def __init__(self, cache_dir=None, store=None):
+        self.root = os.path.join(cache_dir or CACHE_DIR, "plans")
+        self.store = store or SourceAggregateStore(cache_dir)
+        self.last_recomputed = []
+
+    def _state_path(self, template_digest):
+        return os.path.join(self.root, f"plan-{template_digest}.pkl")
+
+    def _load_state(self, template_digest):
+        path = self._state_path(template_digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def _save_state(self, template_digest, state):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            _atomic_write(self._state_path(template_digest), pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            pass
+
+    def build(self, template_df, template_digest, sources, assemble):
+        """
+        参数：
+            template_df: 主计划模板 DataFrame
+            template_digest: 模板内容摘要
+            sources: {file_key: (fingerprint, compute)}，compute() 返回该数据源的汇总长表
+            assemble: assemble(template_df, facts_list) → PlanCube，用于整体重建
+
+        返回：
+            PlanCube
+        """
+        state = self._load_state(template_digest)
+        previous = state["fingerprints"] if state else {}
+        changed = [key for key, (fingerprint, _) in sources.items() if previous.get(key) != fingerprint]
+        self.last_recomputed = changed
+
+        if state is not None and not changed:
+            return state["cube"]
+
+        facts = {
+            key: self.store.get_or_compute(key, sources[key][0], sources[key][1])
+            for key in changed
+        }
+        source_months = dict(state["source_months"]) if state else {}
+        for key, source_facts in facts.items():
+            source_months[key] = fact_months(source_facts)
+
+        months = expand_month_range([m for key in sources for m in source_months.get(key, [])])
+
+        if state is not None and list(state["cube"].months) == months:
+            # 月份区间不变：只替换变化数据源对应的指标
+            cube = state["cube"]
+            for key in changed:
+                partial = PlanCube.from_fact_table(cube.base_df, facts[key], months)
+                metric = SOURCE_METRICS[key]
+                cube = cube.with_metric(metric, partial.metric(metric))
+        else:
+            for key, (fingerprint, compute) in sources.items():
+                if key not in facts:
+                    facts[key] = self.store.get_or_compute(key, fingerprint, compute)
+            cube = assemble(template_df, [facts[key] for key in sources])
+
+        self._save_state(template_digest, {
+            "fingerprints": {key: fingerprint for key, (fingerprint, _) in sources.items()},
+            "source_months": source_months,
+            "cube": cube,
+        })
+        return cube
+
+
+default_planner = IncrementalPlanner()
@@ -1,187 +1,374 @@
+import os
 import re
+import numpy as np
 import pandas as pd
-import streamlit as st
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
+from pandas.api.types import (
+    is_datetime64_any_dtype,
+    is_numeric_dtype,
+    union_categoricals
+)
+from instrumentation import trace_span
 
 
-def extract_all_year_months(df_forecast, df_order, df_sales):
-    # 1. 从 forecast header 提取 x月预测 列中的月份
-    month_pattern = re.compile(r"(\d{1,2})月预测")
-    forecast_months = []
-    for col in df_forecast.columns:
-        match = month_pattern.match(str(col))
-        if match:
-            month = match.group(1).zfill(2)
-            forecast_months.append(f"2025-{month}")  # ✅ 根据需要调整年份
-
-    # 2. 从 order 文件第 B 列（假设是“订单日期”）
-    order_date_col = df_order.columns[11]
-    df_order[order_date_col] = pd.to_datetime(df_order[order_date_col], errors="coerce")
-    order_months = (
-        df_order[order_date_col]
-        .dropna()
-        .dt.to_period("M")
-        .astype(str)
-        .loc[lambda x: x != "NaT"]
-        .unique()
-        .tolist()
-    )
+PLAN_METRICS = ["预测", "订单", "出货"]
 
-    # 3. 从 sales 文件第 F 列（假设是“交易日期”）
-    sales_date_col = df_sales.columns[5]
-    df_sales[sales_date_col] = pd.to_datetime(df_sales[sales_date_col], errors="coerce")
-    sales_months = (
-        df_sales[sales_date_col]
-        .dropna()
-        .dt.to_period("M")
-        .astype(str)
-        .loc[lambda x: x != "NaT"]
-        .unique()
-        .tolist()
-    )
+FACT_COLUMNS = ["品名", "年月", "指标", "数量"]
 
-    # 合并并去重
-    all_months = sorted(set(forecast_months + order_months + sales_months))
+# 事实表 dtype 约定的版本号，变化时已持久化的汇总结果随指纹一起失效
+FACT_SCHEMA_VERSION = 2
 
-    # 生成从最小到最大之间的所有月份
-    if all_months:
-        min_month = pd.Period(min(all_months), freq="M")
-        max_month = pd.Period(max(all_months), freq="M")
-        full_months = [str(p) for p in pd.period_range(min_month, max_month, freq="M")]
+# 预测表“x月预测”列所属年份（预测表表头只有月份）
+PLAN_YEAR = int(os.environ.get("FORECAST_PLAN_YEAR", "2025"))
+
+# 订单 / 出货的归月日期列
+SOURCE_DATE_COLUMNS = {
+    "order": "客户要求交期",
+    "sales": "交易日期",
+}
+
+# 归一化后附加在明细表上的月份序号列，月份识别与汇总共用
+MONTH_KEY_COLUMN = "月序"
+
+# 文本日期依次尝试的显式格式；某列识别出的格式按缓存键记住，后续批次抽样确认仍适用后直接使用
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y.%m.%d",
+    "%Y%m%d",
+]
+_DATE_FORMAT_CACHE = {}
+DATE_FORMAT_SAMPLE_ROWS = 200
+
+# Excel 日期序列号的起点及有效范围（1900-01-01 ~ 9999-12-31）
+EXCEL_EPOCH = "1899-12-30"
+EXCEL_SERIAL_MAX = 2958465
+
+
+def month_ordinal(ym):
+    """
+    "yyyy-mm" → 月份序号（year * 12 + month - 1）。
+    """
+    year, month = str(ym).split("-")[:2]
+    return int(year) * 12 + int(month) - 1
+
+
+def month_label(ordinal):
+    """
+    月份序号 → "yyyy-mm"。
+    """
+    ordinal = int(ordinal)
+    return f"{ordinal // 12:04d}-{ordinal % 12 + 1:02d}"
+
+
+def _detect_date_format(strings):
+    sample = strings[strings != ""].head(DATE_FORMAT_SAMPLE_ROWS)
+    if sample.empty:
+        return None
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors="coerce").notna().all():
+            return fmt
+    return None
+
+
+def _format_fits(strings, fmt):
+    """
+    缓存的格式是否仍适用：抽样中至少一半能按该格式解析。
+    """
+    sample = strings[strings != ""].head(DATE_FORMAT_SAMPLE_ROWS)
+    return sample.empty or pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean() >= 0.5
+
+
+def _parse_date_strings(strings, cache_key=None):
+    strings = strings.astype(str).str.strip()
+    fmt = _DATE_FORMAT_CACHE.get(cache_key)
+    # 同一列换了一份日期格式不同的文件时，重新识别并替换缓存的格式
+    if fmt is None or not _format_fits(strings, fmt):
+        fmt = _detect_date_format(strings)
+        if fmt is not None and cache_key is not None:
+            _DATE_FORMAT_CACHE[cache_key] = fmt
+    if fmt is None:
+        return pd.to_datetime(strings, errors="coerce", format="mixed")
+
+    parsed = pd.to_datetime(strings, format=fmt, errors="coerce")
+    # 个别行格式不同时，只对这些行逐个推断
+    failed = parsed.isna() & (strings != "")
+    if failed.any():
+        parsed[failed] = pd.to_datetime(strings[failed], errors="coerce", format="mixed")
+    return parsed
+
+
+def _numeric_dates(numbers):
+    """
+    数值日期：Excel 序列号，或 yyyymmdd 形式的整数。
+    """
+    numbers = pd.to_numeric(numbers, errors="coerce").astype("float64")
+    serial = numbers.where((numbers >= 1) & (numbers <= EXCEL_SERIAL_MAX))
+    dates = pd.to_datetime(serial, unit="D", origin=EXCEL_EPOCH, errors="coerce")
+
+    compact = numbers.where((numbers >= 1900_01_01) & (numbers <= 9999_12_31) & (numbers % 1 == 0))
+    if compact.notna().any():
+        compact_dates = pd.to_datetime(compact.dropna().astype("int64").astype(str), format="%Y%m%d", errors="coerce")
+        dates[compact_dates.index] = compact_dates
+    return dates
+
+
+def parse_dates(values, cache_key=None):
+    """
+    日期列解析（每列只做一次）：
+    - 已是 datetime 列直接返回
+    - 数值列按 Excel 序列号（或 yyyymmdd）换算
+    - 文本按 DATE_FORMATS 识别出的显式格式解析，格式按 cache_key 缓存；都不匹配时才逐个推断
+    - 混合类型列分别处理各类值
+    """
+    values = pd.Series(values)
+    if is_datetime64_any_dtype(values.dtype):
+        return values
+    if is_numeric_dtype(values.dtype):
+        return _numeric_dates(values)
+
+    kinds = values.map(type)
+    is_text = (kinds == str).to_numpy()
+    is_number = kinds.isin([int, float, np.int64, np.float64]).to_numpy() & values.notna().to_numpy()
+    is_other = ~(is_text | is_number) & values.notna().to_numpy()
+
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    if is_text.any():
+        dates[is_text] = _parse_date_strings(values[is_text], cache_key)
+    if is_number.any():
+        dates[is_number] = _numeric_dates(values[is_number])
+    if is_other.any():
+        dates[is_other] = pd.to_datetime(values[is_other], errors="coerce")
+    return dates
+
+
+def date_month_ordinals(values, cache_key=None):
+    """
+    日期列 → 月份序号（float，无法解析的日期为 NaN）。
+    """
+    dates = parse_dates(values, cache_key)
+    return (dates.dt.year * 12 + dates.dt.month - 1).astype("float64")
+
+
+def with_month_key(file_key, df):
+    """
+    为订单 / 出货明细附加月份序号列 MONTH_KEY_COLUMN（不修改传入的 DataFrame）。
+    已附加过的直接返回，月份识别与汇总共用同一次解析结果。
+    """
+    if MONTH_KEY_COLUMN in df.columns:
+        return df
+    date_col = SOURCE_DATE_COLUMNS[file_key]
+    return df.assign(**{MONTH_KEY_COLUMN: date_month_ordinals(df[date_col], cache_key=f"{file_key}:{date_col}")})
+
+
+def source_months(file_key, df):
+    """
+    明细表涉及的月份（"yyyy-mm"，按时间排序）。
+    """
+    ordinals = with_month_key(file_key, df)[MONTH_KEY_COLUMN].dropna().unique()
+    return [month_label(o) for o in sorted(ordinals)]
+
+
+def fact_months(facts):
+    """
+    事实表涉及的月份，按时间排序的 "yyyy-mm" 列表。
+    """
+    ordinals = pd.unique(facts["年月"].dropna())
+    return [month_label(o) for o in sorted(int(o) for o in ordinals)]
+
+
+def narrow_quantities(values):
+    """
+    数量清洗：无法解析的值按 0 处理；全为整数时压缩到能容纳的最窄整数类型，否则保留 float64。
+    """
+    if isinstance(values, pd.Series):
+        values = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
     else:
-        full_months = []
-    
-    return full_months
+        values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), 0.0, values)
+    if len(values) and np.array_equal(values, np.round(values)) and np.abs(values).max() < 2 ** 62:
+        return pd.to_numeric(values.astype(np.int64), downcast="integer")
+    return values
+
 
-def fill_forecast_data(main_df, df_forecast, forecast_months):
+def empty_facts():
     """
-    从 forecast_file 填入预测数据，按生产料号对应品名，支持月份列为“6月预测”格式。
+    带紧凑 dtype 的空事实表。
     """
-    # 清洗生产料号 → 品名
-    df_forecast["生产料号"] = df_forecast["生产料号"].astype(str).str.strip()
-    df_forecast["品名"] = df_forecast["生产料号"]
+    return pd.DataFrame({
+        "品名": pd.Categorical([]),
+        "年月": np.array([], dtype=np.int32),
+        "指标": pd.Categorical([], categories=PLAN_METRICS),
+        "数量": np.array([], dtype=np.float64),
+    })
+
 
-    # 正则提取“x月预测”字段
+def concat_facts(frames):
+    """
+    合并多张事实表：品名类别取并集，合并后仍为 category（pd.concat 遇到类别不同会退化为 object）。
+    """
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return empty_facts()
+    # 各表类别的 dtype 可能不同（object / str，union_categoricals 的结果也可能变为 str），统一为 object 后再取并集
+    names = [pd.Categorical(f["品名"]) for f in frames]
+    names = union_categoricals(
+        [c.set_categories(c.categories.astype(object)) for c in names], ignore_order=True
+    )
+    facts = pd.concat([f.drop(columns="品名") for f in frames], ignore_index=True)
+    facts.insert(0, "品名", names)
+    return facts[FACT_COLUMNS]
+
+
+def get_forecast_month_columns(df_forecast, plan_year=None):
+    """
+    识别预测表中“x月预测”格式的列，返回 {yyyy-mm: 原列名}；年份取 plan_year（默认 PLAN_YEAR）。
+    """
+    plan_year = PLAN_YEAR if plan_year is None else int(plan_year)
     month_pattern = re.compile(r"(\d{1,2})月预测")
-    forecast_cols = {
-        f"2025-{match.group(1).zfill(2)}": col
+    return {
+        f"{plan_year:04d}-{match.group(1).zfill(2)}": col
         for col in df_forecast.columns
         if (match := month_pattern.match(str(col)))
     }
 
-    for ym in forecast_months:
-        colname = f"{ym}-预测"
-        if colname in main_df.columns and ym in forecast_cols:
-            month_col = forecast_cols[ym]
 
-            # ✅ 按品名汇总（避免重复索引）
-            forecast_series = (
-                df_forecast.groupby("品名")[month_col]
-                .sum(min_count=1)
-            )
+def extract_all_year_months(df_forecast, df_order, df_sales, plan_year=None):
+    """
+    预测 / 订单 / 出货涉及的全部月份，补全为连续区间。
+    订单 / 出货可传入 with_month_key 的结果，以复用已解析的月份序号；传入的 DataFrame 不会被修改。
+    """
+    # 1. 从 forecast header 提取 x月预测 列中的月份
+    forecast_months = list(get_forecast_month_columns(df_forecast, plan_year))
+
+    # 2. 从 order 文件“客户要求交期”列
+    order_months = source_months("order", df_order)
 
-            main_df[colname] = main_df["品名"].map(forecast_series).fillna(0)
+    # 3. 从 sales 文件“交易日期”列
+    sales_months = source_months("sales", df_sales)
+
+    # 合并并去重
+    all_months = sorted(set(forecast_months + order_months + sales_months))
 
-    return main_df
+    # 生成从最小到最大之间的所有月份
+    return expand_month_range(all_months)
 
 
-def fill_order_data(main_df, df_order, forecast_months):
+def expand_month_range(months):
     """
-    将订单数据按“订单日期”和“品名”聚合并填入 main_df 中每月的“订单”列。
-    
-    参数：
-    - main_df: 主计划 DataFrame，需包含“品名”列
-    - df_order: 上传的未交订单 DataFrame，包含“订单日期”和“品名”
-    - forecast_months: 所有涉及的 yyyy-mm 字符串列表
+    将若干 yyyy-mm 月份补全为从最小到最大之间的连续月份列表。
     """
-    df_order = df_order.copy()
+    months = [m for m in months if isinstance(m, str) and m and m != "NaT"]
+    if not months:
+        return []
+    min_month = pd.Period(min(months), freq="M")
+    max_month = pd.Period(max(months), freq="M")
+    return [str(p) for p in pd.period_range(min_month, max_month, freq="M")]
 
-    # 确保日期字段为 datetime 类型
-    df_order["客户要求交期"] = pd.to_datetime(df_order["客户要求交期"], errors="coerce")
-    df_order["年月"] = df_order["客户要求交期"].dt.to_period("M").astype(str)
 
-    # 数值字段清洗
-    df_order["订单数量"] = pd.to_numeric(df_order["订单数量"], errors="coerce").fillna(0)
+def _to_fact_frame(names, months, quantities, metric):
+    """
+    组装紧凑 dtype 的事实表：品名 category、年月 int32 月份序号、指标 category、数量最窄数值类型；
+    丢弃无法归月的行。
+    """
+    months = np.asarray(months, dtype=np.float64)
+    valid = ~np.isnan(months)
+    return pd.DataFrame({
+        "品名": pd.Categorical(names)[valid],
+        "年月": months[valid].astype(np.int32),
+        "指标": pd.Categorical.from_codes(
+            np.full(int(valid.sum()), PLAN_METRICS.index(metric), dtype=np.int8), categories=PLAN_METRICS
+        ),
+        "数量": narrow_quantities(quantities)[valid],
+    })
 
-    # 聚合出每品名每月的订单量
-    grouped = (
-        df_order.groupby(["品名", "年月"])["订单数量"]
-        .sum()
-        .unstack()
-        .fillna(0)
-    )
 
-    for ym in forecast_months:
-        colname = f"{ym}-订单"
-        if colname in main_df.columns and ym in grouped.columns:
-            main_df[colname] = main_df["品名"].map(grouped[ym]).fillna(0)
+def melt_forecast_data(df_forecast, plan_year=None):
+    """
+    将预测表的“x月预测”宽列展开为长表（品名, 年月, 指标, 数量），品名取生产料号。
+    """
+    forecast_cols = get_forecast_month_columns(df_forecast, plan_year)
+    if not forecast_cols:
+        return empty_facts()
 
-    return main_df
+    names = df_forecast["生产料号"]
+    if not isinstance(names.dtype, pd.CategoricalDtype):
+        # 经料号替换的品名已是清洗过的 category，其余情况在此清洗
+        names = names.astype(str).str.strip()
+    names = pd.Categorical(names)
 
-def fill_sales_data(main_df, df_sales, forecast_months):
+    # 按月份列逐列展开：品名编码平铺，月份序号重复
+    n_rows, n_months = len(names), len(forecast_cols)
+    long_names = pd.Categorical.from_codes(np.tile(names.codes, n_months), categories=names.categories)
+    months = np.repeat([month_ordinal(ym) for ym in forecast_cols], n_rows)
+    quantities = df_forecast[list(forecast_cols.values())].apply(pd.to_numeric, errors="coerce")
+    return _to_fact_frame(long_names, months, quantities.to_numpy(dtype=np.float64).ravel(order="F"), "预测")
+
+
+def melt_order_data(df_order):
     """
-    将出货数据按“交易日期”和“品名”聚合并填入 main_df 中每月的“出货”列。
-    
-    参数：
-    - main_df: 主计划 DataFrame，需包含“品名”列
-    - df_sales: 出货明细 DataFrame，包含“交易日期”和“品名”
-    - forecast_months: 所有涉及的 yyyy-mm 字符串列表
+    未交订单 → 长表，按“客户要求交期”归月，数量取“订单数量”。
     """
-    df_sales = df_sales.copy()
+    df_order = with_month_key("order", df_order)
+    return _to_fact_frame(df_order["品名"], df_order[MONTH_KEY_COLUMN], df_order["订单数量"], "订单")
+
 
-    # 确保交易日期为 datetime
-    df_sales["交易日期"] = pd.to_datetime(df_sales["交易日期"], errors="coerce")
-    df_sales["年月"] = df_sales["交易日期"].dt.to_period("M").astype(str)
+def melt_sales_data(df_sales):
+    """
+    出货明细 → 长表，按“交易日期”归月，数量取“数量”。
+    """
+    df_sales = with_month_key("sales", df_sales)
+    return _to_fact_frame(df_sales["品名"], df_sales[MONTH_KEY_COLUMN], df_sales["数量"], "出货")
 
-    # 数值字段清洗
-    df_sales["数量"] = pd.to_numeric(df_sales["数量"], errors="coerce").fillna(0)
 
-    # 聚合：每品名每月出货数量
-    grouped = (
-        df_sales.groupby(["品名", "年月"])["数量"]
-        .sum()
-        .unstack()
-        .fillna(0)
-    )
+# 各数据源的品名字段及展开函数
+SOURCE_FIELD_MAPPINGS = {
+    "forecast": {"品名": "生产料号"},
+    "order": {"品名": "品名"},
+    "sales": {"品名": "品名"}
+}
 
-    for ym in forecast_months:
-        colname = f"{ym}-出货"
-        if colname in main_df.columns and ym in grouped.columns:
-            main_df[colname] = main_df["品名"].map(grouped[ym]).fillna(0)
+SOURCE_MELTERS = {
+    "forecast": melt_forecast_data,
+    "order": melt_order_data,
+    "sales": melt_sales_data,
+}
 
-    return main_df
+# 各数据源对应的主计划指标
+SOURCE_METRICS = {
+    "forecast": "预测",
+    "order": "订单",
+    "sales": "出货",
+}
 
-def highlight_by_detecting_column_headers(ws):
+
+def aggregate_facts(facts):
     """
-    自动识别表头第二行中连续的“预测/订单”列对，并对值为：预测>0且订单=0 的单元格标红。
+    按（品名, 年月, 指标）汇总事实表，行数压缩到 SKU × 月份 量级。
+    三个键均为整数编码（category / int32），只对出现过的组合分组。
     """
-    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    max_col = ws.max_column
-    max_row = ws.max_row
+    return facts.groupby(["品名", "年月", "指标"], as_index=False, sort=False, observed=True)["数量"].sum()
 
-    header = [cell.value for cell in ws[2]]
 
-    # 遍历所有列找出“预测-订单”成对列索引
-    column_pairs = []
-    for i in range(len(header) - 1):
-        name1 = str(header[i]).strip()
-        name2 = str(header[i + 1]).strip()
-        if name1.endswith("预测") and name2.endswith("订单"):
-            column_pairs.append((i + 1, i + 2))  # openpyxl列从1开始
+def melt_source(file_key, df, plan_year=None):
+    """
+    按数据源展开为长表；plan_year 只对预测表生效。
+    """
+    if file_key == "forecast":
+        return melt_forecast_data(df, plan_year)
+    return SOURCE_MELTERS[file_key](df)
 
-    # 遍历每行，检查成对列
-    for row in range(3, ws.max_row + 1):
-        for forecast_col, order_col in column_pairs:
-            cell_forecast = ws.cell(row=row, column=forecast_col)
-            cell_order = ws.cell(row=row, column=order_col)
 
-            try:
-                val_forecast = float(cell_forecast.value or 0)
-                val_order = float(cell_order.value or 0)
-            except:
-                continue
+def extract_source_facts(file_key, df, part_index, plan_year=None):
+    """
+    单个数据源：料号替换 → 展开为长表 → 汇总。part_index 为 PartNumberIndex。
+    """
+    with trace_span(f"mapping:{file_key}") as span:
+        span.set_input(df)
+        df, _, _ = part_index.apply(df, SOURCE_FIELD_MAPPINGS[file_key])
+        span.set_output(df)
 
-            if val_forecast > 0 and val_order == 0:
-                cell_forecast.fill = red_fill
-                cell_order.fill = red_fill
+    with trace_span(f"aggregate:{file_key}") as span:
+        span.set_input(df)
+        return span.set_output(aggregate_facts(melt_source(file_key, df, plan_year)))
@@ -0,0 +1,292 @@
+import contextlib
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+import time
+import tracemalloc
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块，不统计 RSS
+    resource = None
+
+# 默认是否开启追踪（页面侧边栏也可随时开关）
+TRACE_ENABLED = os.environ.get("FORECAST_TRACE", "") not in ("", "0", "false")
+TRACE_MEMORY = os.environ.get("FORECAST_TRACE_MEMORY", "") not in ("", "0", "false")
+
+# 当前运行使用的 Tracer：每次运行（每个页面会话的每次生成）各自激活，互不覆盖
+_CURRENT_TRACER = contextvars.ContextVar("forecast_tracer", default=None)
+
+# tracemalloc 是进程级的：按正在统计内存的运行数引用计数，最后一个结束时关闭
+_TRACEMALLOC_USERS = 0
+_TRACEMALLOC_LOCK = threading.Lock()
+
+
+def _acquire_tracemalloc():
+    global _TRACEMALLOC_USERS
+    with _TRACEMALLOC_LOCK:
+        if _TRACEMALLOC_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _TRACEMALLOC_USERS += 1
+
+
+def _release_tracemalloc():
+    global _TRACEMALLOC_USERS
+    with _TRACEMALLOC_LOCK:
+        _TRACEMALLOC_USERS -= 1
+        if _TRACEMALLOC_USERS == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def frame_shape(obj):
+    """
+    DataFrame / Series / PlanCube 等带 shape 对象的（行数, 列数），多维时其余维度合并为列数；
+    其他对象返回 None。
+    """
+    if isinstance(obj, pd.Series):
+        return (len(obj), 1)
+    shape = getattr(obj, "shape", None)
+    if isinstance(shape, tuple) and len(shape) >= 2:
+        return (shape[0], math.prod(shape[1:]))
+    return None
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _NullSpan:
+    """
+    追踪关闭时使用的空实现，进入 / 退出不做任何事。
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_input(self, obj):
+        pass
+
+    def set_output(self, obj):
+        return obj
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, meta):
+        self.tracer = tracer
+        self.event = {"stage": name, **meta}
+        self.peak_seen = 0
+
+    def set_input(self, obj):
+        shape = frame_shape(obj)
+        if shape is not None:
+            self.event["rows_in"], self.event["cols_in"] = shape
+
+    def set_output(self, obj):
+        shape = frame_shape(obj)
+        if shape is not None:
+            self.event["rows_out"], self.event["cols_out"] = shape
+        return obj
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1] if stack else None
+        self.event["depth"] = len(stack)
+        self.event["thread"] = threading.current_thread().name
+        stack.append(self)
+
+        self.memory = self.tracer.memory and tracemalloc.is_tracing()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.peak_seen = max(self.parent.peak_seen, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+
+        self.event["start"] = round(time.perf_counter() - self.tracer.origin, 6)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.event["seconds"] = round(time.perf_counter() - self.start, 6)
+        if exc_type is not None:
+            self.event["error"] = f"{exc_type.__name__}: {exc}"
+
+        if self.memory:
+            peak = max(self.peak_seen, tracemalloc.get_traced_memory()[1])
+            if self.parent is not None:
+                self.parent.peak_seen = max(self.parent.peak_seen, peak)
+            self.event["alloc_peak_mb"] = round((peak - self.start_memory) / 1024 / 1024, 3)
+        rss = _max_rss_mb()
+        if rss is not None:
+            self.event["max_rss_mb"] = round(rss, 1)
+
+        self.tracer._stack().pop()
+        self.tracer._record(self.event)
+        return False
+
+
+class Tracer:
+    """
+    分阶段性能追踪：墙钟耗时、tracemalloc 分配峰值（可选）、进程 RSS 峰值、输入输出行列数。
+
+    - enabled=False 时 span() 返回空实现，traced 装饰的函数直接调用原函数，开销可忽略
+    - 支持嵌套（depth 记录层级）与多线程（每线程独立的 span 栈）
+    - 子进程中的解析不计入，只记录父进程中包裹它的阶段
+    - 每次运行新建一个 Tracer 并用 activate() 激活；各模块通过 trace_span / traced
+      记录到当前激活的 Tracer，未激活时记录到 default_tracer
+    - 内存峰值来自进程级的 tracemalloc，多个运行并发时会包含其他运行的分配
+    """
+
+    def __init__(self, enabled=TRACE_ENABLED, memory=TRACE_MEMORY):
+        self.enabled = enabled
+        self.memory = memory
+        self.events = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def configure(self, enabled=None, memory=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if memory is not None:
+            self.memory = memory
+
+    def reset(self):
+        """
+        清空已记录的阶段，开始新一轮追踪。
+        """
+        with self._lock:
+            self.events = []
+        self.origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        在当前上下文（线程 / 会话）中把本 Tracer 设为当前 Tracer；开启内存统计时
+        在激活期间启用 tracemalloc。
+        """
+        token = _CURRENT_TRACER.set(self)
+        memory = self.enabled and self.memory
+        if memory:
+            _acquire_tracemalloc()
+        try:
+            yield self
+        finally:
+            if memory:
+                _release_tracemalloc()
+            _CURRENT_TRACER.reset(token)
+
+    def span(self, name, **meta):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, meta)
+
+    def traced(self, name=None):
+        """
+        装饰器：记录到本 Tracer（固定绑定）；模块代码请使用模块级 traced，记录到当前 Tracer。
+        """
+        return _traced(lambda: self, name)
+
+    def snapshot(self):
+        """
+        按开始时间排序的阶段记录副本。
+        """
+        with self._lock:
+            return sorted((dict(e) for e in self.events), key=lambda e: e["start"])
+
+    def to_json(self):
+        return json.dumps({"memory": self.memory, "stages": self.snapshot()}, ensure_ascii=False, indent=2)
+
+    def summary(self):
+        """
+        阶段记录的 DataFrame 视图（嵌套阶段按层级缩进），便于页面展示。
+        """
+        events = self.snapshot()
+        if not events:
+            return pd.DataFrame()
+        frame = pd.DataFrame(events)
+        frame["stage"] = ["　" * e["depth"] + e["stage"] for e in events]
+        columns = [
+            col for col in ["stage", "seconds", "alloc_peak_mb", "max_rss_mb",
+                            "rows_in", "cols_in", "rows_out", "cols_out", "thread", "error"]
+            if col in frame.columns
+        ]
+        return frame[columns]
+
+
+def _traced(get_tracer, name=None):
+    """
+    装饰器：记录函数耗时，并以第一个 DataFrame 参数 / 返回值统计输入输出行列数。
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = get_tracer()
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(stage_name) as span:
+                for arg in (*args, *kwargs.values()):
+                    if frame_shape(arg) is not None:
+                        span.set_input(arg)
+                        break
+                result = func(*args, **kwargs)
+                span.set_output(result[0] if isinstance(result, tuple) and result else result)
+                return result
+        return wrapper
+    return decorator
+
+
+default_tracer = Tracer()
+
+
+def current_tracer():
+    """
+    当前上下文中激活的 Tracer；未激活时为 default_tracer。
+    """
+    return _CURRENT_TRACER.get() or default_tracer
+
+
+def trace_span(name, **meta):
+    """
+    在当前 Tracer 中记录一个阶段（with 语句使用）。
+    """
+    return current_tracer().span(name, **meta)
+
+
+def traced(name=None):
+    """
+    装饰器：调用时记录到当前 Tracer。
+    """
+    return _traced(current_tracer, name)
+
+
+def submit_in_context(pool, fn, *args, **kwargs):
+    """
+    向线程池提交任务并带上当前上下文，使工作线程中的阶段记录到同一个 Tracer。
+    """
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
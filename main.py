@@ -2,34 +2,113 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from io import BytesIO
-from ui import get_uploaded_files
-from pivot_processor import PivotProcessor
-from github_utils import load_file_with_github_fallback
+from ui import get_uploaded_files, session_id, setup_sidebar, show_plan_viewer, show_trace_panel, show_upload_status
+from background_render import default_renderer
+from excel_cache import read_uploaded_bytes
+from github_upload import default_uploader
+from github_utils import FILENAME_KEYS
+from concurrent_loader import InputLoadError
+from pipeline_cache import cached_export, cached_plan_view, run_cached_pipeline
+from plan_export import EXPORT_FORMATS, EXPORT_LAYOUTS, export_file_name
+
+# 后台渲染未完成时的轮询间隔（秒）
+RENDER_POLL_SECONDS = 0.5
+
+
+def excel_download(plan_key, cube):
+    """
+    Excel 在后台渲染：未完成时由定时片段轮询，完成后整页重跑一次显示下载按钮。
+    """
+    future = default_renderer.submit(plan_key, cube)
+    if not future.done():
+        excel_render_progress(plan_key, cube)
+        return
+
+    try:
+        excel_bytes = future.result()
+    except Exception as e:
+        st.error(f"❌ Excel 文件生成失败：{e}")
+        return
+
+    st.download_button(
+        label="📥 下载主计划 Excel 文件",
+        data=excel_bytes,
+        file_name=f"预测分析主计划_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+
+@st.fragment(run_every=RENDER_POLL_SECONDS)
+def excel_render_progress(plan_key, cube):
+    """
+    只在渲染未完成时使用的定时片段；渲染结束后整页重跑，由 excel_download 显示结果。
+    """
+    if default_renderer.submit(plan_key, cube).done():
+        st.rerun()
+    st.info("⏳ 正在后台生成 Excel 文件，可先查看上方表格…")
+
 
 def main():
     st.set_page_config(page_title="预测分析主计划工具", layout="wide")
     st.title("📊 预测分析主计划生成器")
+    plan_year, sync_uploads, tracer = setup_sidebar()
     
     template_file, forecast_file, order_file, sales_file, mapping_file, start = get_uploaded_files()
     
-    if start:    
-        template_df = load_file_with_github_fallback("template", template_file, sheet_name=0, header=1)
-        forecast_df = load_file_with_github_fallback("forecast", forecast_file, sheet_name=0)
-        order_df = load_file_with_github_fallback("order", order_file, sheet_name="Sheet")
-        sales_df = load_file_with_github_fallback("sales", sales_file, sheet_name="原表")
-    
-        processor = PivotProcessor()
-        df_result, excel_output = processor.process(template_df, forecast_df, order_df, sales_df, mapping_file)
-    
+    if start:
+        uploaded_files = {
+            "template": template_file,
+            "forecast": forecast_file,
+            "order": order_file,
+            "sales": sales_file,
+            "mapping": mapping_file,
+        }
+        # 勾选同步时，上传的文件在后台提交到 GitHub（内容未变化的跳过），不阻塞主计划生成
+        if sync_uploads:
+            for file_key, filename in FILENAME_KEYS.items():
+                if uploaded_files[file_key] is not None:
+                    default_uploader.submit(filename, read_uploaded_bytes(uploaded_files[file_key]), owner=session_id())
+
+        try:
+            with tracer.activate(), tracer.span("pipeline"):
+                plan_key, cube = run_cached_pipeline(uploaded_files, plan_year=plan_year)
+        except InputLoadError as e:
+            for file_key, message in e.errors.items():
+                st.error(f"❌ {file_key} 加载失败：{message}")
+            st.stop()
+        finally:
+            st.session_state["trace"] = (tracer.summary(), tracer.to_json())
+        # 结果保存在 session_state 中，点击下载等交互触发的重跑无需重新计算
+        st.session_state["plan_result"] = (plan_key, cube)
+
+    if "plan_result" in st.session_state:
+        plan_key, cube = st.session_state["plan_result"]
+
         st.success("✅ 主计划生成成功！")
-        st.dataframe(df_result, use_container_width=True)
+        # 计划留在服务端，只把当前页 / 列窗口发送到页面；“有预测无订单”等改为快捷筛选
+        show_plan_viewer(cached_plan_view(plan_key, cube))
     
-        st.download_button(
-            label="📥 下载主计划 Excel 文件",
-            data=excel_output.getvalue(),
-            file_name=f"预测分析主计划_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        excel_download(plan_key, cube)
+
+        with st.expander("🗂️ 列式导出（Parquet / Arrow / CSV）"):
+            fmt_col, layout_col = st.columns(2)
+            fmt = fmt_col.selectbox("格式", list(EXPORT_FORMATS), key="export_format")
+            layout = layout_col.selectbox(
+                "布局", list(EXPORT_LAYOUTS), key="export_layout",
+                format_func=lambda x: {"long": "长表（SKU × 年月 × 指标）", "wide": "宽表（同 Excel）"}[x]
+            )
+            st.download_button(
+                label=f"📥 下载 {fmt} 文件",
+                data=cached_export(plan_key, fmt, layout, cube),
+                file_name=export_file_name(f"预测分析主计划_{datetime.now().strftime('%Y%m%d_%H%M%S')}", fmt, layout),
+                mime=EXPORT_FORMATS[fmt][1]
+            )
+
+    if "trace" in st.session_state:
+        show_trace_panel(*st.session_state["trace"])
+
+    with st.sidebar:
+        show_upload_status()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from excel_cache import CACHE_DIR, content_hash
+from github_utils import INPUT_SPECS, read_excel_bytes
+from mapping_utils import MAPPING_COLUMNS, PartNumberIndex, split_mapping_data
+
+# 编译产物格式版本：清洗 / 拆分 / 索引结构变化时递增，旧产物随即失效
+MAPPING_ARTIFACT_VERSION = 2
+# 磁盘上保留的编译产物数、内存中保留的已加载产物数
+MAPPING_ARTIFACTS_KEPT = 8
+MAPPING_ARTIFACTS_IN_MEMORY = 4
+
+
+def mapping_fingerprint(mapping_digest):
+    """
+    编译产物指纹：新旧料号表内容摘要 + 产物格式版本。
+    """
+    return hashlib.sha256(f"{mapping_digest}|v{MAPPING_ARTIFACT_VERSION}".encode("utf-8")).hexdigest()
+
+
+def validate_mapping_headers(mapping_df):
+    """
+    编译前校验表头：去掉表头首尾空格，缺少拆分所需的列时报错。
+    """
+    mapping_df = mapping_df.rename(columns=lambda col: str(col).strip())
+    missing = [col for col in MAPPING_COLUMNS if col not in mapping_df.columns]
+    if missing:
+        raise ValueError(f"❌ 新旧料号表缺少列：{missing}，现有列：{list(mapping_df.columns)}")
+    return mapping_df
+
+
+class MappingArtifact:
+    """
+    新旧料号表的编译产物：清洗后的半成品 / 新旧料号 / 替代料号三张表，
+    以及编译好的 PartNumberIndex（旧品名 / 替代品名 → 新品名 的查找字典与 closure）。
+    """
+
+    def __init__(self, fingerprint, mapping_semi, mapping_new, mapping_sub, part_index):
+        self.version = MAPPING_ARTIFACT_VERSION
+        self.fingerprint = fingerprint
+        self.mapping_semi = mapping_semi
+        self.mapping_new = mapping_new
+        self.mapping_sub = mapping_sub
+        self.part_index = part_index
+
+    @classmethod
+    def compile(cls, mapping_df, fingerprint):
+        mapping_semi, mapping_new, mapping_sub = split_mapping_data(validate_mapping_headers(mapping_df))
+        return cls(fingerprint, mapping_semi, mapping_new, mapping_sub, PartNumberIndex(mapping_new, mapping_sub))
+
+    @property
+    def cycles(self):
+        return self.part_index.cycles
+
+
+class MappingStore:
+    """
+    新旧料号编译产物的本地存储：以 mapping_fingerprint 为键持久化 MappingArtifact（pickle），
+    同一份新旧料号表只解析、校验、编译一次，之后直接加载。
+    """
+
+    def __init__(self, cache_dir=None, artifacts_kept=MAPPING_ARTIFACTS_KEPT, in_memory=MAPPING_ARTIFACTS_IN_MEMORY):
+        self.root = os.path.join(cache_dir or CACHE_DIR, "mapping")
+        self.artifacts_kept = artifacts_kept
+        self.in_memory = in_memory
+        self.compiled = 0
+        self.loaded = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, fingerprint):
+        return os.path.join(self.root, f"{fingerprint}.pkl")
+
+    def has(self, mapping_digest):
+        fingerprint = mapping_fingerprint(mapping_digest)
+        return fingerprint in self._memory or os.path.exists(self._path(fingerprint))
+
+    def load(self, mapping_digest):
+        fingerprint = mapping_fingerprint(mapping_digest)
+        with self._lock:
+            artifact = self._memory.get(fingerprint)
+            if artifact is not None:
+                self._memory.move_to_end(fingerprint)
+                return artifact
+
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                artifact = pickle.load(f)
+        except Exception:
+            return None
+        if getattr(artifact, "version", None) != MAPPING_ARTIFACT_VERSION:
+            return None
+        os.utime(path)
+
+        with self._lock:
+            self.loaded += 1
+            self._remember(artifact)
+        return artifact
+
+    def save(self, artifact):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(artifact.fingerprint)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def load_or_compile(self, content, mapping_digest=None, mapping_df=None):
+        """
+        返回新旧料号表内容对应的 MappingArtifact；未编译过时解析（或使用已解析的 mapping_df）、
+        校验表头并编译，再写入磁盘。
+        """
+        mapping_digest = mapping_digest or content_hash(content)
+        artifact = self.load(mapping_digest)
+        if artifact is not None:
+            return artifact
+
+        if mapping_df is None:
+            sheet_name, header = INPUT_SPECS["mapping"]
+            mapping_df = read_excel_bytes(content, sheet_name=sheet_name, header=header, file_key="mapping")
+        artifact = MappingArtifact.compile(mapping_df, mapping_fingerprint(mapping_digest))
+        try:
+            self.save(artifact)
+        except OSError:
+            # 缓存目录不可写时只保留内存中的产物
+            pass
+
+        with self._lock:
+            self.compiled += 1
+            self._remember(artifact)
+        return artifact
+
+    def _remember(self, artifact):
+        self._memory[artifact.fingerprint] = artifact
+        self._memory.move_to_end(artifact.fingerprint)
+        while len(self._memory) > self.in_memory:
+            self._memory.popitem(last=False)
+
+    def _prune(self):
+        paths = [os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith(".pkl")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.artifacts_kept:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {"compiled": self.compiled, "loaded": self.loaded}
+
+
+default_mapping_store = MappingStore()
@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
+from instrumentation import traced
+from streamlit_compat import notify
 
 def apply_all_name_replacements(df, mapping_new, mapping_sub, sheet_name, field_mappings, verbose=False):
     """
@@ -30,11 +32,9 @@ def apply_all_name_replacements(df, mapping_new, mapping_sub, sheet_name, field_
     if actual_name_col not in df.columns:
         raise ValueError(f"❌ {sheet_name} 中未找到列：{actual_name_col}")
 
-    # Step 1️⃣ 新旧料号替换
-    df, mapped_main = apply_mapping_and_merge(df.copy(), mapping_new, {"品名": actual_name_col}, verbose=verbose)
-
-    # Step 2️⃣ 替代品名替换
-    df, mapped_sub = apply_extended_substitute_mapping(df, mapping_sub, {"品名": actual_name_col}, verbose=verbose)
+    # 新旧料号替换 + 替代品名替换（编译索引，一次完成）
+    index = PartNumberIndex(mapping_new, mapping_sub)
+    df, mapped_main, mapped_sub = index.apply(df, {"品名": actual_name_col}, verbose=verbose)
 
     all_mapped_keys = mapped_main.union(mapped_sub)
 
@@ -69,7 +69,7 @@ def clean_mapping_headers(mapping_df):
 
 def replace_all_names_with_mapping(all_names: pd.Series, mapping_new: pd.DataFrame, mapping_sub: pd.DataFrame) -> pd.Series:
     """
-    对品名列表 all_names 应用新旧料号 + 替代料号替换，返回去重后的替换结果。
+    对品名列表 all_names 应用新旧料号 + 替代料号替换（含多级链条），返回去重后的替换结果。
 
     参数：
         all_names: 原始品名列表（pd.Series）
@@ -82,133 +82,38 @@ def replace_all_names_with_mapping(all_names: pd.Series, mapping_new: pd.DataFra
     if not isinstance(all_names, pd.Series):
         return all_names
 
-    all_names = all_names.dropna().astype(str).str.strip()
-
-    # 1️⃣ 新旧料号替换
-    if mapping_new is not None and not mapping_new.empty:
-        mapping_new = mapping_new.copy()
-        mapping_new["旧品名"] = mapping_new["旧品名"].astype(str).str.strip()
-        mapping_new["新品名"] = mapping_new["新品名"].astype(str).str.strip()
-
-        df_names = all_names.to_frame(name="品名")
-        merged = df_names.merge(
-            mapping_new[["旧品名", "新品名"]],
-            how="left",
-            left_on="品名",
-            right_on="旧品名"
-        )
-        merged["最终品名"] = merged["新品名"].where(
-            merged["新品名"].notna() & (merged["新品名"].str.strip() != ""),
-            merged["品名"]
-        )
-        all_names = merged["最终品名"]
-
-    # 2️⃣ 替代料号替换
-    if mapping_sub is not None and not mapping_sub.empty:
-        mapping_sub = mapping_sub.copy()
-        mapping_sub["新品名"] = mapping_sub["新品名"].astype(str).str.strip()
-
-        for i in range(1, 5):
-            sub_col = f"替代品名{i}"
-            if sub_col not in mapping_sub.columns:
-                continue
-
-            mapping_sub[sub_col] = mapping_sub[sub_col].astype(str).str.strip()
-
-            valid_subs = mapping_sub[
-                mapping_sub[sub_col].notna() &
-                (mapping_sub[sub_col] != "") &
-                mapping_sub["新品名"].notna() &
-                (mapping_sub["新品名"] != "")
-            ]
-
-            if not valid_subs.empty:
-                sub_map = valid_subs.set_index(sub_col)["新品名"]
-                all_names = all_names.replace(sub_map)
+    # 新旧料号 + 替代料号替换：沿 PartNumberGraph 的 closure 一步解析到最终品名
+    index = PartNumberIndex(mapping_new, mapping_sub)
+    all_names = index.resolve(all_names.dropna()).astype(object)
 
     # 去重排序后返回
     return all_names.dropna().drop_duplicates().reset_index(drop=True)
 
 
-def apply_mapping_and_merge(df, mapping_df, field_map, verbose=False):
-    """
-    按品名字段替换主料号（新旧料号映射）
-    对 df 中的品名列进行逐行检查：
-        若该品名在 mapping_df 中的“旧品名”列中存在，且对应“新品名”非空，
-        则将其替换为该新品名。
-    返回修改后的 DataFrame 和所有成功替换的新品名集合。
-    """
-    name_col = field_map["品名"]
-    df = df.copy()
-    df[name_col] = df[name_col].astype(str).str.strip()
-    mapping_df = mapping_df.copy()
-    mapping_df["旧品名"] = mapping_df["旧品名"].astype(str).str.strip()
-    mapping_df["新品名"] = mapping_df["新品名"].astype(str).str.strip()
-
-    # 构造旧 -> 新 的映射字典，排除新品名为空的行
-    mapping_dict = dict(
-        mapping_df[mapping_df["新品名"] != ""][["旧品名", "新品名"]].values
-    )
-
-    replaced_names = set()
-    # 逐行替换
-    df[name_col] = df[name_col].apply(lambda x: mapping_dict[x] if x in mapping_dict else x)
+# 新旧料号表中参与拆分的列（原表表头）
+MAPPING_COLUMNS = [
+    "旧晶圆", "旧规格", "旧品名",
+    "新晶圆", "新规格", "新品名",
+    "半成品",
+    "替代晶圆1", "替代规格1", "替代品名1",
+    "替代晶圆2", "替代规格2", "替代品名2",
+    "替代晶圆3", "替代规格3", "替代品名3",
+    "替代晶圆4", "替代规格4", "替代品名4"
+]
 
-    # 记录被替换的新品名（即原品名 != 映射后的品名）
-    replaced_names = set(mapping_dict.values()).intersection(set(df[name_col]))
-
-    if verbose:
-        st.write(f"✅ 新旧料号替换成功: {len(replaced_names)} 项")
+SEMI_COLUMNS = ["新晶圆", "新规格", "新品名", "半成品"]
+NEW_COLUMNS = ["旧晶圆", "旧规格", "旧品名", "新晶圆", "新规格", "新品名"]
+SUB_COLUMNS = ["新晶圆", "新规格", "新品名", "替代晶圆", "替代规格", "替代品名"]
 
-    return df, replaced_names
 
-def apply_extended_substitute_mapping(df, mapping_df, field_map, verbose=False):
+def normalize_mapping_frame(mapping_df: pd.DataFrame) -> pd.DataFrame:
     """
-    替代料号品名替换（仅品名字段替换，无聚合合并）
+    只保留 MAPPING_COLUMNS，并一次性清洗为字符串：去首尾空格与换行，空值 / "nan" 统一为空串。
     """
-    name_col = field_map["品名"]
-    df = df.copy()
-    df[name_col] = df[name_col].astype(str).str.strip().str.replace("\n", "").str.replace("\r", "")
-
-    df = df[df[name_col] != ""].copy()
-
-    # 清洗映射表中所有替代品名及新品名
-    substitute_records = []
-    for i in range(1, 5):
-        sub_name = f"替代品名"
-        for col in [sub_name, "新品名"]:
-            if col not in mapping_df.columns:
-                mapping_df[col] = ""
-            mapping_df[col] = mapping_df[col].astype(str).str.strip().str.replace("\n", "").str.replace("\r", "")
-
-        valid_rows = mapping_df[
-            mapping_df[[sub_name, "新品名"]].notna().all(axis=1) &
-            (mapping_df[sub_name] != "") &
-            (mapping_df["新品名"] != "")
-        ]
-
-        for _, row in valid_rows.iterrows():
-            substitute_records.append({
-                "旧品名": row[sub_name],
-                "新品名": row["新品名"]
-            })
-
-    # 替换品名
-    matched_keys = set()
-    for sub in substitute_records:
-        mask = (df[name_col] == sub["旧品名"])
-        if mask.any():
-            """
-            if verbose:
-                st.write(f"🔁 替代品名: {sub['旧品名']} → {sub['新品名']}，行数: {mask.sum()}")
-            """
-            df.loc[mask, name_col] = sub["新品名"]
-            matched_keys.update(df.loc[mask, name_col])
-
-    if verbose:
-        st.success(f"✅ 替代品名替换完成，共替换: {len(matched_keys)} 种")
-
-    return df, matched_keys
+    return pd.DataFrame({
+        col: _clean_name_series(mapping_df[col]).fillna("").replace("nan", "")
+        for col in MAPPING_COLUMNS
+    }, index=mapping_df.index)
 
 
 def split_mapping_data(mapping_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
@@ -218,50 +123,209 @@ def split_mapping_data(mapping_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataF
     - mapping_new: 新旧料号映射（旧品名→新品名）
     - mapping_sub: 替代料号映射（新品名→替代品名）
 
+    各列先经 normalize_mapping_frame 清洗一次，拆出的三张表均为清洗后的字符串。
+
     返回：
         mapping_semi, mapping_new, mapping_sub
     """
-    # === 半成品映射 ===
-    mapping_semi1 = mapping_df[["新晶圆", "新规格", "新品名", "半成品"]].copy()
-    mapping_semi1 = mapping_semi1[
-        ~mapping_df["半成品"].astype(str).str.strip().replace("nan", "").eq("") &
-        ~mapping_df["新品名"].astype(str).str.strip().replace("nan", "").eq("")
-    ].copy()
-
-    mapping_semi2 = mapping_df[
-        ["新晶圆", "新规格", "新品名", "旧晶圆", "旧规格", "旧品名", "半成品"]
-    ].copy()
-    mapping_semi2 = mapping_semi2[
-        mapping_semi2["新品名"].astype(str).str.strip().replace("nan", "") == ""
-    ]
-    mapping_semi2 = mapping_semi2[
-        ~mapping_semi2["半成品"].astype(str).str.strip().replace("nan", "").eq("") &
-        ~mapping_semi2["旧品名"].astype(str).str.strip().replace("nan", "").eq("")
-    ]
-    mapping_semi2 = mapping_semi2.drop(columns=["新晶圆", "新规格", "新品名"])
-    mapping_semi2.columns = ["新晶圆", "新规格", "新品名", "半成品"]
-
+    df = normalize_mapping_frame(mapping_df)
+    has_new = df["新品名"] != ""
+    has_old = df["旧品名"] != ""
+    has_semi = df["半成品"] != ""
+
+    # === 半成品映射：有新品名的按新品名，没有新品名的按旧品名 ===
+    mapping_semi1 = df.loc[has_new & has_semi, SEMI_COLUMNS]
+    mapping_semi2 = df.loc[~has_new & has_old & has_semi, ["旧晶圆", "旧规格", "旧品名", "半成品"]]
+    mapping_semi2.columns = SEMI_COLUMNS
     mapping_semi = pd.concat([mapping_semi1, mapping_semi2], ignore_index=True)
 
     # === 新旧料号映射 ===
-    mapping_new = mapping_df[
-        ["旧晶圆", "旧规格", "旧品名", "新晶圆", "新规格", "新品名"]
-    ].copy()
-    mapping_new = mapping_new[
-        ~mapping_df["新品名"].astype(str).str.strip().replace("nan", "").eq("") &
-        ~mapping_df["旧品名"].astype(str).str.strip().replace("nan", "").eq("")
-    ].copy()
-
-    # === 替代料号映射 ===
-    mapping_sub = pd.DataFrame()
+    mapping_new = df.loc[has_new & has_old, NEW_COLUMNS]
+
+    # === 替代料号映射：替代品名1~4 展开为长表 ===
+    sub_frames = []
     for i in range(1, 5):
-        sub_cols = ["新晶圆", "新规格", "新品名", f"替代晶圆{i}", f"替代规格{i}", f"替代品名{i}"]
-        sub_df = mapping_df[sub_cols].copy()
-        valid_mask = ~sub_df[f"替代品名{i}"].astype(str).str.strip().replace("nan", "").eq("")
-        sub_df = sub_df[valid_mask].copy()
-        sub_df.columns = ["新晶圆", "新规格", "新品名", "替代晶圆", "替代规格", "替代品名"]
-        mapping_sub = pd.concat([mapping_sub, sub_df], ignore_index=True)
+        sub_df = df.loc[
+            df[f"替代品名{i}"] != "",
+            ["新晶圆", "新规格", "新品名", f"替代晶圆{i}", f"替代规格{i}", f"替代品名{i}"]
+        ]
+        sub_df.columns = SUB_COLUMNS
+        sub_frames.append(sub_df)
+    mapping_sub = pd.concat(sub_frames, ignore_index=True)
 
     return mapping_semi, mapping_new, mapping_sub
 
-    
+
+def _clean_name_series(names: pd.Series) -> pd.Series:
+    """
+    品名统一清洗：转字符串、去首尾空格、去掉换行符。
+    """
+    return names.astype(str).str.strip().str.replace("\n", "").str.replace("\r", "")
+
+
+def _build_name_lookup(mapping_df, key_col, value_col, keep):
+    """
+    从映射表构造 key_col → value_col 的查找字典，跳过任一侧为空的行。
+    keep 决定重复 key 时保留哪一条（与原逐行替换的先后语义保持一致）。
+    """
+    if mapping_df is None or mapping_df.empty or key_col not in mapping_df.columns:
+        return {}
+
+    pairs = pd.DataFrame({
+        "key": _clean_name_series(mapping_df[key_col]),
+        "value": _clean_name_series(mapping_df[value_col]),
+    })
+    pairs = pairs[~pairs["key"].isin(["", "nan"]) & ~pairs["value"].isin(["", "nan"])]
+    pairs = pairs.drop_duplicates(subset="key", keep=keep)
+    return dict(zip(pairs["key"], pairs["value"]))
+
+
+class PartNumberGraph:
+    """
+    新旧料号有向图：旧品名 → 新品名、替代品名 → 新品名 各为一条边，
+    每个品名至多一条出边（新旧料号优先于替代料号）。
+
+    编译时预先计算每个品名沿出边走到底的最终品名（closure），
+    old→new→newer、substitute→new→newer 这类链条一次查表即可解析到底。
+    若存在环（如 A→B→A），环上所有品名统一归并到环内排序最小的品名，
+    并记录在 cycles 中供调用方提示。指向自身的边（旧品名 / 替代品名 = 新品名）
+    不改变品名，合并后直接丢弃，不算作环。
+    """
+
+    def __init__(self, new_edges, sub_edges):
+        edges = dict(sub_edges)
+        edges.update(new_edges)
+        self.edges = {name: target for name, target in edges.items() if name != target}
+        self.edge_kind = {name: "sub" for name in sub_edges if name in self.edges}
+        self.edge_kind.update({name: "new" for name in new_edges if name in self.edges})
+        self.cycles = []
+        self.closure = self._compute_closure()
+
+    @classmethod
+    def from_mappings(cls, mapping_new, mapping_sub):
+        # 旧品名 → 新品名：与 dict(values) 一致，重复旧品名以最后一条为准
+        new_edges = _build_name_lookup(mapping_new, "旧品名", "新品名", keep="last")
+        # 替代品名 → 新品名：与逐条 mask 替换一致，重复替代品名以第一条为准
+        # 兼容 split_mapping_data 的长表（替代品名）与原表宽表（替代品名1~4）两种格式
+        sub_edges = {}
+        for sub_col in ["替代品名4", "替代品名3", "替代品名2", "替代品名1", "替代品名"]:
+            sub_edges.update(_build_name_lookup(mapping_sub, sub_col, "新品名", keep="first"))
+        return cls(new_edges, sub_edges)
+
+    def _compute_closure(self):
+        closure = {}
+        for start in self.edges:
+            if start in closure:
+                continue
+
+            # 沿出边前进，直到终点、已解析节点或回到本轮路径上的节点
+            path = []
+            on_path = {}
+            node = start
+            while node in self.edges and node not in closure and node not in on_path:
+                on_path[node] = len(path)
+                path.append(node)
+                node = self.edges[node]
+
+            if node in on_path:
+                cycle = path[on_path[node]:]
+                self.cycles.append(cycle)
+                target = min(cycle)
+            elif node in closure:
+                target = closure[node]
+            else:
+                target = node
+
+            for name in path:
+                closure[name] = target
+
+        return closure
+
+    def canonical(self, name):
+        """
+        返回单个品名的最终品名；未出现在映射中的品名原样返回。
+        """
+        return self.closure.get(name, name)
+
+
+class PartNumberIndex:
+    """
+    料号解析索引：由 split_mapping_data 拆出的 mapping_new / mapping_sub 一次性编译成
+    PartNumberGraph，预测、订单、出货三张表以及 replace_all_names_with_mapping 共用。
+
+    resolve 先对品名列 factorize，只在去重后的品名上查 closure，再按编码回填，
+    因此替换成本与行数线性相关，与映射条数及链条长度无关。
+    """
+
+    def __init__(self, mapping_new, mapping_sub):
+        self.graph = PartNumberGraph.from_mappings(mapping_new, mapping_sub)
+
+    @classmethod
+    def from_mapping_df(cls, mapping_df):
+        """
+        直接从新旧料号原表构建索引。
+        """
+        _, mapping_new, mapping_sub = split_mapping_data(mapping_df)
+        return cls(mapping_new, mapping_sub)
+
+    @property
+    def cycles(self):
+        return self.graph.cycles
+
+    def _resolve_codes(self, names):
+        """
+        清洗并替换品名：每个不同品名只解析一次，结果为以最终品名为类别的 Categorical。
+
+        返回：
+            categorical: 替换后的品名（category）
+            codes, uniques: 清洗后原始品名的 factorize 结果
+            resolved: uniques 对应的最终品名列表
+        """
+        codes, uniques = pd.factorize(_clean_name_series(names))
+        resolved = [self.graph.canonical(name) for name in uniques]
+        resolved_codes, categories = pd.factorize(pd.Index(resolved, dtype=object))
+        final_codes = np.full(len(codes), -1, dtype=np.intp)
+        valid = codes >= 0
+        final_codes[valid] = resolved_codes[codes[valid]]
+        return pd.Categorical.from_codes(final_codes, categories=categories), codes, uniques, resolved
+
+    @traced("PartNumberIndex.resolve")
+    def resolve(self, names: pd.Series) -> pd.Series:
+        """
+        对品名 Series 执行“新旧料号 + 替代料号”替换，返回清洗并替换后的 category Series（索引不变）。
+        """
+        categorical, _, _, _ = self._resolve_codes(names)
+        return pd.Series(categorical, index=names.index, name=names.name)
+
+    @traced("PartNumberIndex.apply")
+    def apply(self, df, field_map, verbose=False):
+        """
+        替换 df 中 field_map["品名"] 指定的品名列，并去掉品名为空的行。
+
+        返回：
+            df: 替换后的 DataFrame（副本）
+            replaced_main: 经新旧料号替换得到的最终品名集合
+            replaced_sub: 经替代料号替换得到的最终品名集合
+        """
+        name_col = field_map["品名"]
+        df = df.copy()
+
+        # 品名列转为 category：后续展开、汇总、与模板对齐都在整数编码上进行
+        categorical, codes, uniques, resolved = self._resolve_codes(df[name_col])
+        df[name_col] = categorical
+        df = df[df[name_col] != ""].copy()
+        df[name_col] = df[name_col].cat.remove_unused_categories()
+
+        replaced_main, replaced_sub = set(), set()
+        for i in pd.unique(codes):
+            kind = self.graph.edge_kind.get(uniques[i])
+            if kind == "new":
+                replaced_main.add(resolved[i])
+            elif kind == "sub":
+                replaced_sub.add(resolved[i])
+
+        if verbose:
+            notify("write", f"✅ 新旧料号替换成功: {len(replaced_main)} 项")
+            notify("success", f"✅ 替代品名替换完成，共替换: {len(replaced_sub)} 种")
+
+        return df, replaced_main, replaced_sub
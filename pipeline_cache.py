@@ -0,0 +1,146 @@
+import hashlib
+import streamlit as st
+from background_render import default_renderer
+from concurrent_loader import InputLoadError, fetch_inputs_concurrently, parse_inputs_concurrently
+from excel_cache import content_hash
+from github_utils import INPUT_SPECS, read_excel_bytes
+from history_store import HISTORY_SOURCES, HistoryStore
+from incremental_plan import default_planner, source_fingerprint
+from info_extract import PLAN_YEAR
+from instrumentation import trace_span
+from mapping_store import default_mapping_store
+from pivot_processor import PivotProcessor
+from plan_viewer import PlanView
+from stream_ingest import aggregate_source_stream, should_stream
+
+# 参与汇总的数据源
+SOURCE_KEYS = ("forecast", "order", "sales")
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_read_inputs(digest_items, _contents):
+    """
+    加载阶段：多进程并行解析，按各文件内容摘要缓存解析结果。
+    单个文件变化时其余文件直接命中本地 Excel 缓存。
+    """
+    frames, errors = parse_inputs_concurrently(_contents)
+    if errors:
+        raise InputLoadError(errors)
+    return frames
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def cached_part_index(mapping_digest, _content, _mapping_df=None):
+    """
+    映射编译阶段：同一份新旧料号表只编译一次，编译产物持久化在本地，重启后直接加载。
+    """
+    return PivotProcessor().load_mapping_content(_content, mapping_digest, _mapping_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_plan(plan_key, template_digest, _template_df, _sources):
+    """
+    汇总阶段：plan_key 由全部输入摘要组合而成，任一输入变化才会重新计算；
+    重新计算时由 IncrementalPlanner 只重算变化的数据源并拼接回上一次的计划。
+    """
+    return default_planner.build(_template_df, template_digest, _sources, PivotProcessor().assemble_plan)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_export(plan_key, fmt, layout, _cube):
+    """
+    列式导出阶段：同一计划的同一格式 / 布局只导出一次，返回文件字节。
+    """
+    return PivotProcessor().export(_cube, fmt=fmt, layout=layout).getvalue()
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def cached_plan_view(plan_key, _cube):
+    """
+    页面浏览索引：按计划指纹构建一次前缀索引与快捷筛选掩码，翻页、筛选时直接查询。
+    """
+    return PlanView(_cube)
+
+
+def make_plan_key(digests):
+    """
+    由各输入摘要组合出计划指纹（与输入顺序无关）。
+    """
+    joined = "|".join(f"{key}={digests[key]}" for key in sorted(digests))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+def run_cached_pipeline(uploaded_files, plan_year=None):
+    """
+    带分阶段缓存的主计划流程。
+
+    参数：
+        uploaded_files: {file_key: UploadedFile 或 None}，file_key 见 github_utils.INPUT_SPECS
+        plan_year: 预测表“x月预测”列所属年份，默认 PLAN_YEAR
+
+    返回：
+        plan_key, cube
+        Excel 已提交到后台渲染，用 default_renderer.submit(plan_key, cube) 取得 Future。
+    """
+    # 并发获取全部输入文件（上传文件直接读取，其余并发从 GitHub 条件下载）
+    with trace_span("fetch_inputs"):
+        contents, errors = fetch_inputs_concurrently(uploaded_files)
+    if errors:
+        raise InputLoadError(errors)
+    digests = {key: content_hash(content) for key, content in contents.items()}
+
+    # 启用历史库的数据源：本次明细先入库，汇总改为读取历史分区，指纹取历史库版本
+    history_keys = [key for key in SOURCE_KEYS if key in HISTORY_SOURCES]
+    history = HistoryStore() if history_keys else None
+    for key in history_keys:
+        sheet_name, header = INPUT_SPECS[key]
+        with trace_span(f"history_ingest:{key}"):
+            history.ingest_content(key, contents[key], sheet_name, header, source_digest=digests[key])
+        digests[key] = history.version(key)
+
+    mapping_digest = digests["mapping"]
+    plan_year = PLAN_YEAR if plan_year is None else int(plan_year)
+    fingerprints = {key: source_fingerprint(digests[key], mapping_digest) for key in SOURCE_KEYS}
+    # 预测月份的年份由参数决定，计入预测汇总的指纹
+    fingerprints["forecast"] = source_fingerprint(f"{digests['forecast']}|{plan_year}", mapping_digest)
+
+    # 只解析模板、尚未编译过的新旧料号表，以及汇总结果尚未持久化的数据源；大文件走流式汇总
+    streamed = {key for key in SOURCE_KEYS if should_stream(key, contents[key])}
+    pending = {
+        key for key in SOURCE_KEYS
+        if key not in history_keys and not default_planner.store.has(key, fingerprints[key])
+    }
+    to_parse = {
+        key: content for key, content in contents.items()
+        if key == "template"
+        or (key == "mapping" and not default_mapping_store.has(mapping_digest))
+        or (key in pending and key not in streamed)
+    }
+    with trace_span("parse_inputs", files=sorted(to_parse)):
+        frames = cached_read_inputs(tuple(sorted((key, digests[key]) for key in to_parse)), to_parse)
+
+    with trace_span("compile_mapping", bytes=len(contents["mapping"])):
+        part_index = cached_part_index(mapping_digest, contents["mapping"], frames.get("mapping"))
+
+    def compute_facts(file_key):
+        if file_key in history_keys:
+            return history.read_facts(file_key, part_index)
+        if file_key in streamed:
+            sheet_name, header = INPUT_SPECS[file_key]
+            return aggregate_source_stream(file_key, contents[file_key], sheet_name, part_index, header=header)
+        source_df = frames.get(file_key)
+        if source_df is None:
+            sheet_name, header = INPUT_SPECS[file_key]
+            source_df = read_excel_bytes(contents[file_key], sheet_name=sheet_name, header=header, file_key=file_key)
+        return PivotProcessor().source_facts(file_key, source_df, part_index, plan_year)
+
+    sources = {key: (fingerprints[key], lambda key=key: compute_facts(key)) for key in SOURCE_KEYS}
+
+    plan_key = make_plan_key({**digests, "plan_year": plan_year})
+    with trace_span("plan") as span:
+        span.set_input(frames["template"])
+        cube = span.set_output(cached_plan(plan_key, digests["template"], frames["template"], sources))
+
+    # Excel 渲染放到后台，页面先展示汇总结果
+    default_renderer.submit(plan_key, cube)
+    return plan_key, cube
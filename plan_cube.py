@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from info_extract import PLAN_METRICS, month_ordinal
+
+BASE_COLUMNS = ["晶圆品名", "规格", "品名"]
+
+
+class PlanCube:
+    """
+    主计划的核心内存结构：SKU × 月份 × 指标 三维数组。
+
+    - values: 形状为 (SKU 数, 月份数, 3) 的连续 float64 数组，最后一维依次为 预测 / 订单 / 出货
+    - base_df: 每个 SKU 行的基本字段（晶圆品名、规格、品名），行序与 values 第一维一致
+    - skus / months: 品名与 yyyy-mm 月份索引数组
+
+    宽表 DataFrame（“yyyy-mm-指标”列）只在 to_frame 时按需生成并缓存，
+    预测无订单判断、月份切片、合计等都直接在数组上完成。
+    """
+
+    def __init__(self, base_df, months, values):
+        self.base_df = base_df[BASE_COLUMNS].reset_index(drop=True)
+        self.skus = self.base_df["品名"].to_numpy()
+        self.months = np.asarray(months, dtype=object)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+
+        expected = (len(self.skus), len(self.months), len(PLAN_METRICS))
+        if self.values.shape != expected:
+            raise ValueError(f"❌ PlanCube 数组形状不匹配：{self.values.shape}，应为 {expected}")
+
+        self._frame = None
+
+    @classmethod
+    def from_fact_table(cls, base_df, facts, months):
+        """
+        由长格式事实表（品名, 年月, 指标, 数量）直接构建。
+
+        品名 / 年月 / 指标 先换算为 SKU、月份、指标的整数下标，再用一次 bincount 累加到数组中；
+        模板中重复的品名共享同一份数据，模板中没有的品名被丢弃。
+        """
+        base_names = pd.Index(base_df["品名"])
+        uniques = base_names.unique()
+
+        names = pd.Categorical(facts["品名"])
+        sku_of_category = uniques.get_indexer(names.categories)
+        sku_codes = np.full(len(names), -1, dtype=np.intp)
+        named = names.codes >= 0
+        sku_codes[named] = sku_of_category[names.codes[named]]
+
+        month_codes = pd.Index([month_ordinal(ym) for ym in months], dtype=np.int64).get_indexer(
+            facts["年月"].to_numpy(dtype=np.int64)
+        )
+        metric_codes = pd.Categorical(facts["指标"], categories=PLAN_METRICS).codes
+
+        keep = (sku_codes >= 0) & (month_codes >= 0) & (metric_codes >= 0)
+        n_months, n_metrics = len(months), len(PLAN_METRICS)
+        flat = (sku_codes[keep] * n_months + month_codes[keep]) * n_metrics + metric_codes[keep]
+        quantities = np.nan_to_num(facts["数量"].to_numpy(dtype=np.float64)[keep])
+
+        totals = np.bincount(flat, weights=quantities, minlength=len(uniques) * n_months * n_metrics)
+        values = totals.reshape(len(uniques), n_months, n_metrics)[uniques.get_indexer(base_names)]
+        return cls(base_df, months, values)
+
+    def __getstate__(self):
+        # 宽表缓存可由数组重建，不随对象序列化
+        state = self.__dict__.copy()
+        state["_frame"] = None
+        return state
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def metric_index(self, metric):
+        if metric not in PLAN_METRICS:
+            raise ValueError(f"❌ 未知指标：{metric}，可选 {PLAN_METRICS}")
+        return PLAN_METRICS.index(metric)
+
+    def metric(self, metric):
+        """
+        返回某一指标的 (SKU 数, 月份数) 二维视图。
+        """
+        return self.values[:, :, self.metric_index(metric)]
+
+    def column_names(self):
+        return [f"{ym}-{metric}" for ym in self.months for metric in PLAN_METRICS]
+
+    def to_frame(self):
+        """
+        生成宽表 DataFrame：基本字段 + 每月“预测 / 订单 / 出货”三列，结果缓存复用。
+        """
+        if self._frame is None:
+            n_sku, n_months, n_metrics = self.values.shape
+            block = pd.DataFrame(
+                self.values.reshape(n_sku, n_months * n_metrics),
+                columns=self.column_names()
+            )
+            self._frame = pd.concat([self.base_df, block], axis=1)
+        return self._frame
+
+    def forecast_without_order_mask(self):
+        """
+        预测>0 且 订单=0 的布尔掩码，形状为 (SKU 数, 月份数)。
+        """
+        return (self.metric("预测") > 0) & (self.metric("订单") == 0)
+
+    def forecast_without_order_rows(self):
+        """
+        将预测无订单掩码展开为明细表：基本字段 + 年月 + 预测数量，便于页面展示。
+        """
+        sku_idx, month_idx = np.nonzero(self.forecast_without_order_mask())
+        rows = self.base_df.iloc[sku_idx].reset_index(drop=True)
+        rows["年月"] = self.months[month_idx]
+        rows["预测"] = self.metric("预测")[sku_idx, month_idx]
+        return rows
+
+    def with_metric(self, metric, metric_values):
+        """
+        替换某一指标的 (SKU 数, 月份数) 数据，返回新的 PlanCube（原对象不变）。
+        """
+        values = self.values.copy()
+        values[:, :, self.metric_index(metric)] = metric_values
+        return PlanCube(self.base_df, self.months, values)
+
+    def slice_months(self, start=None, end=None):
+        """
+        按 yyyy-mm 闭区间截取月份，返回新的 PlanCube。
+        """
+        keep = np.ones(len(self.months), dtype=bool)
+        if start is not None:
+            keep &= self.months >= start
+        if end is not None:
+            keep &= self.months <= end
+        return PlanCube(self.base_df, self.months[keep], self.values[:, keep, :])
+
+    def totals(self, by="month"):
+        """
+        合计：
+        - by="month": 每月各指标合计，索引为月份
+        - by="sku": 每个 SKU 各指标合计，行序同 base_df
+        """
+        if by == "month":
+            return pd.DataFrame(self.values.sum(axis=0), index=self.months, columns=PLAN_METRICS)
+        if by == "sku":
+            totals = pd.DataFrame(self.values.sum(axis=1), columns=PLAN_METRICS)
+            return pd.concat([self.base_df, totals], axis=1)
+        raise ValueError(f"❌ 不支持的合计维度：{by}")
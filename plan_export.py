@@ -0,0 +1,104 @@
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from info_extract import PLAN_METRICS
+from plan_cube import BASE_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 导出格式 → 文件扩展名 / MIME
+EXPORT_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+    "csv": ("csv", "text/csv"),
+}
+
+# long：每行一个（SKU, 年月, 指标）；wide：与 Excel 相同的“yyyy-mm-指标”列
+EXPORT_LAYOUTS = ("long", "wide")
+
+LONG_COLUMNS = BASE_COLUMNS + ["年月", "指标", "数量"]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ValueError("❌ 列式导出需要安装 pyarrow")
+
+
+def _string_array(values):
+    """
+    基本字段统一导出为字符串（空值为 null），避免模板中数字 / 文本混排导致列类型随数据变化。
+    """
+    return pa.array([None if pd.isna(v) else str(v) for v in values], type=pa.string())
+
+
+def plan_schema(cube, layout):
+    """
+    导出表结构：基本字段为 string，数量为 float64；wide 布局的月份列按月份 × 指标顺序排列。
+    """
+    _require_pyarrow()
+    base_fields = [pa.field(col, pa.string()) for col in BASE_COLUMNS]
+    if layout == "long":
+        return pa.schema(base_fields + [
+            pa.field("年月", pa.string()),
+            pa.field("指标", pa.string()),
+            pa.field("数量", pa.float64()),
+        ])
+    if layout == "wide":
+        return pa.schema(base_fields + [pa.field(col, pa.float64()) for col in cube.column_names()])
+    raise ValueError(f"❌ 不支持的导出布局：{layout}，可选 {EXPORT_LAYOUTS}")
+
+
+def plan_to_arrow(cube, layout="wide"):
+    """
+    由 PlanCube 的数组直接构建 Arrow 表（不经过宽表 DataFrame）。
+    """
+    schema = plan_schema(cube, layout)
+    base = {col: _string_array(cube.base_df[col].tolist()) for col in BASE_COLUMNS}
+    n_sku, n_months, n_metrics = cube.shape
+
+    if layout == "wide":
+        flat = cube.values.reshape(n_sku, n_months * n_metrics)
+        columns = [base[col] for col in BASE_COLUMNS] + [
+            pa.array(np.ascontiguousarray(flat[:, i]), type=pa.float64()) for i in range(flat.shape[1])
+        ]
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    # long：按 SKU → 月份 → 指标 的顺序展开，基本字段按行号重复取值
+    repeat = n_months * n_metrics
+    row_index = pa.array(np.repeat(np.arange(n_sku), repeat))
+    columns = [base[col].take(row_index) for col in BASE_COLUMNS] + [
+        pa.array(np.tile(np.repeat(cube.months.astype(str), n_metrics), n_sku), type=pa.string()),
+        pa.array(np.tile(np.asarray(PLAN_METRICS), n_sku * n_months), type=pa.string()),
+        pa.array(cube.values.reshape(-1), type=pa.float64()),
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def export_plan(cube, fmt="parquet", layout="long"):
+    """
+    将主计划导出为 Parquet / Arrow IPC / CSV，返回 BytesIO。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"❌ 不支持的导出格式：{fmt}，可选 {list(EXPORT_FORMATS)}")
+    table = plan_to_arrow(cube, layout)
+
+    output = BytesIO()
+    if fmt == "parquet":
+        pq.write_table(table, output)
+    elif fmt == "arrow":
+        with pa_ipc.new_file(output, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pa_csv.write_csv(table, output)
+    output.seek(0)
+    return output
+
+
+def export_file_name(stem, fmt, layout):
+    return f"{stem}.{layout}.{EXPORT_FORMATS[fmt][0]}"
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from info_extract import PLAN_METRICS
+from plan_cube import BASE_COLUMNS
+
+# 每页 SKU 行数、每屏展示的月份数（列窗口）
+VIEW_PAGE_SIZE = 50
+VIEW_MONTH_WINDOW = 6
+
+# 快捷筛选：key → (显示名, 由 PlanCube 生成 (SKU 数, 月份数) 布尔掩码的函数)
+QUICK_FILTERS = {
+    "forecast_without_order": ("有预测无订单", lambda cube: cube.forecast_without_order_mask()),
+    "order_without_forecast": ("有订单无预测", lambda cube: (cube.metric("订单") > 0) & (cube.metric("预测") == 0)),
+    "active": ("有任一数量", lambda cube: (cube.values != 0).any(axis=2)),
+}
+
+
+class _PrefixIndex:
+    """
+    单个字段的前缀索引：规范化（去空格、转大写）后排序，前缀查询为两次二分查找。
+    """
+
+    def __init__(self, values):
+        keys = np.array(["" if pd.isna(v) else str(v).strip().upper() for v in values], dtype=str)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def rows(self, prefix):
+        prefix = prefix.strip().upper()
+        lo = np.searchsorted(self.sorted_keys, prefix, side="left")
+        hi = np.searchsorted(self.sorted_keys, prefix + "\U0010ffff", side="left")
+        return self.order[lo:hi]
+
+
+class PlanView:
+    """
+    主计划的服务端浏览索引：计划数组留在服务端，页面每次只取当前页、当前列窗口。
+
+    - 晶圆品名 / 规格 / 品名 前缀索引（不区分大小写）
+    - 月份区间：月份有序，按 yyyy-mm 二分定位
+    - 快捷筛选：QUICK_FILTERS 的掩码按月份累计预先计算，任意月份区间内
+      “是否出现过”只需一次相减
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+        self.months = cube.months.astype(str)
+        self.indexes = {col: _PrefixIndex(cube.base_df[col].tolist()) for col in BASE_COLUMNS}
+
+        self._counts = {}
+        for key, (_, build_mask) in QUICK_FILTERS.items():
+            mask = np.asarray(build_mask(cube), dtype=np.int32)
+            counts = np.zeros((mask.shape[0], mask.shape[1] + 1), dtype=np.int32)
+            np.cumsum(mask, axis=1, out=counts[:, 1:])
+            self._counts[key] = counts
+
+    @property
+    def n_skus(self):
+        return self.cube.shape[0]
+
+    def month_bounds(self, start=None, end=None):
+        """
+        yyyy-mm 闭区间 → 月份下标半开区间 (i0, i1)。
+        """
+        i0 = 0 if start is None else int(np.searchsorted(self.months, start, side="left"))
+        i1 = len(self.months) if end is None else int(np.searchsorted(self.months, end, side="right"))
+        return i0, max(i0, i1)
+
+    def quick_mask(self, key, i0, i1):
+        """
+        月份下标 [i0, i1) 内掩码至少出现一次的 SKU（布尔数组）。
+        """
+        if key not in QUICK_FILTERS:
+            raise ValueError(f"❌ 未知的快捷筛选：{key}，可选 {list(QUICK_FILTERS)}")
+        counts = self._counts[key]
+        return counts[:, i1] > counts[:, i0]
+
+    def quick_counts(self, start=None, end=None):
+        """
+        月份区间内各快捷筛选命中的 SKU 数，供页面标签展示。
+        """
+        i0, i1 = self.month_bounds(start, end)
+        return {key: int(self.quick_mask(key, i0, i1).sum()) for key in QUICK_FILTERS}
+
+    def query(self, prefixes=None, start=None, end=None, quick=None):
+        """
+        按前缀（{字段: 前缀}，多个字段同时满足）、月份区间与快捷筛选查找 SKU，
+        返回按模板顺序排列的行号数组。
+        """
+        keep = np.ones(self.n_skus, dtype=bool)
+        for col, prefix in (prefixes or {}).items():
+            if col not in self.indexes:
+                raise ValueError(f"❌ 不支持前缀检索的字段：{col}，可选 {BASE_COLUMNS}")
+            if prefix and prefix.strip():
+                hit = np.zeros(self.n_skus, dtype=bool)
+                hit[self.indexes[col].rows(prefix)] = True
+                keep &= hit
+        if quick:
+            keep &= self.quick_mask(quick, *self.month_bounds(start, end))
+        return np.flatnonzero(keep)
+
+    def page(self, rows, page=0, page_size=VIEW_PAGE_SIZE, start=None, end=None,
+             month_offset=0, month_window=VIEW_MONTH_WINDOW, metrics=PLAN_METRICS):
+        """
+        取第 page 页（从 0 开始）、月份区间内从 month_offset 起 month_window 个月的宽表片段。
+        列名与 Excel 一致（“yyyy-mm-指标”）。
+        """
+        i0, i1 = self.month_bounds(start, end)
+        m0 = min(i0 + max(0, month_offset), i1)
+        m1 = min(m0 + month_window, i1)
+        page_rows = rows[page * page_size:(page + 1) * page_size]
+        metric_idx = [self.cube.metric_index(metric) for metric in metrics]
+
+        block = self.cube.values[page_rows, m0:m1][:, :, metric_idx]
+        columns = [f"{ym}-{metric}" for ym in self.months[m0:m1] for metric in metrics]
+        frame = self.cube.base_df.iloc[page_rows].reset_index(drop=True)
+        values = pd.DataFrame(block.reshape(len(page_rows), len(columns)), columns=columns)
+        return pd.concat([frame, values], axis=1)
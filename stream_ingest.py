@@ -0,0 +1,68 @@
+import os
+from io import BytesIO
+import pandas as pd
+from openpyxl import load_workbook
+from excel_reader import REQUIRED_COLUMNS, select_columns
+from info_extract import aggregate_facts, concat_facts, empty_facts, extract_source_facts
+
+# 每批读取的行数
+STREAM_CHUNK_ROWS = 50000
+
+# 订单 / 出货文件超过该大小时自动改用流式读取
+STREAMING_THRESHOLD_BYTES = int(os.environ.get("FORECAST_STREAMING_THRESHOLD_MB", "20")) * 1024 * 1024
+
+# 支持流式读取的数据源（按日期逐行归月的明细表）
+STREAMABLE_SOURCES = ("order", "sales")
+
+
+def should_stream(file_key, content):
+    return file_key in STREAMABLE_SOURCES and len(content) > STREAMING_THRESHOLD_BYTES
+
+
+def iter_sheet_chunks(content, sheet_name=0, header=0, usecols=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    以 openpyxl read-only 模式逐行读取工作表，每 chunk_rows 行产出一个 DataFrame。
+    header 为表头所在行号（从 0 开始），usecols 同 REQUIRED_COLUMNS（列名 / 正则）。
+    """
+    wb = load_workbook(BytesIO(content), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        rows = ws.iter_rows(values_only=True)
+
+        for _ in range(header):
+            next(rows, None)
+        header_row = next(rows, None)
+        if header_row is None:
+            return
+
+        positions = select_columns(header_row, usecols) if usecols is not None else []
+        positions = positions or list(range(len(header_row)))
+        names = [str(header_row[i]).strip() for i in positions]
+
+        buffer = []
+        for row in rows:
+            buffer.append([row[i] if i < len(row) else None for i in positions])
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=names)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=names)
+    finally:
+        wb.close()
+
+
+def aggregate_source_stream(file_key, content, sheet_name, part_index, header=0, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    流式读取订单 / 出货明细：每批做料号替换、归月并累加到按（品名, 年月）的汇总中。
+    峰值内存取决于 SKU × 月份 数量，而不是原始行数。
+
+    返回与 extract_source_facts 相同结构的汇总长表（品名, 年月, 指标, 数量）。
+    """
+    totals = empty_facts()
+    for chunk in iter_sheet_chunks(content, sheet_name, header, REQUIRED_COLUMNS.get(file_key), chunk_rows):
+        chunk_facts = extract_source_facts(file_key, chunk, part_index)
+        if totals.empty:
+            totals = chunk_facts
+        else:
+            totals = aggregate_facts(concat_facts([totals, chunk_facts]))
+    return totals
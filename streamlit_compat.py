@@ -0,0 +1,41 @@
+import logging
+import os
+import sys
+
+logger = logging.getLogger("forecast_analysis")
+
+
+def _active_streamlit():
+    """
+    正在 Streamlit 页面中运行时返回 streamlit 模块，否则返回 None（不会触发 streamlit 导入）。
+    """
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return None
+    try:
+        return st if st.runtime.exists() else None
+    except AttributeError:
+        return None
+
+
+def notify(level, message):
+    """
+    页面提示：Streamlit 中调用 st.write / st.success / st.warning / st.error，
+    命令行等无页面环境下写入日志。
+    """
+    st = _active_streamlit()
+    if st is not None:
+        getattr(st, level)(message)
+        return
+    log_level = {"warning": logging.WARNING, "error": logging.ERROR}.get(level, logging.INFO)
+    logger.log(log_level, message)
+
+
+def get_secret(key):
+    """
+    读取密钥：优先环境变量，其次 Streamlit secrets（仅在需要时导入 streamlit）。
+    """
+    if os.environ.get(key):
+        return os.environ[key]
+    import streamlit as st
+    return st.secrets[key]
@@ -0,0 +1,184 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import github_utils
+from github_utils import REPO_NAME
+from http_client import HttpClient
+
+
+def _blob_sha(content):
+    return hashlib.sha1(f"blob {len(content)}\0".encode("utf-8") + content).hexdigest()
+
+
+class FakeGitHub:
+    """
+    GitHub 替身：contents 目录列表 / PUT，以及 Git Data API 的 blob → tree → commit → ref 流程。
+    fail 为待返回的失败状态码队列（按写请求依次消耗）。
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {"c0": {"tree": "t0", "parents": []}}
+        self.head = "c0"
+        self.calls = []
+        self.fail = []
+        self.lock = threading.Lock()
+
+    def handle(self, method, path, body):
+        with self.lock:
+            self.calls.append((method, path))
+            if method != "GET" and self.fail:
+                return self.fail.pop(0), {"message": "injected failure"}
+            return self._route(method, path, body)
+
+    def _route(self, method, path, body):
+        if method == "GET" and path.startswith("contents"):
+            parent = path[len("contents"):].strip("/")
+            entries = [
+                {"name": name.rsplit("/", 1)[-1], "type": "file", "sha": _blob_sha(content)}
+                for name, content in self.files.items()
+                if (name.rsplit("/", 1)[0] if "/" in name else "") == parent
+            ]
+            return 200, entries
+        if method == "PUT" and path.startswith("contents/"):
+            name = path[len("contents/"):]
+            old = self.files.get(name)
+            if old is not None and body.get("sha") != _blob_sha(old):
+                return 409, {"message": "sha does not match"}
+            content = base64.b64decode(body["content"])
+            self.files[name] = content
+            return (201 if old is None else 200), {"content": {"sha": _blob_sha(content)}}
+        if method == "POST" and path == "git/blobs":
+            content = base64.b64decode(body["content"])
+            self.blobs[_blob_sha(content)] = content
+            return 201, {"sha": _blob_sha(content)}
+        if method == "GET" and path == "git/ref/heads/main":
+            return 200, {"object": {"sha": self.head}}
+        if method == "GET" and path.startswith("git/commits/"):
+            return 200, {"tree": {"sha": self.commits[path.rsplit("/", 1)[-1]]["tree"]}}
+        if method == "POST" and path == "git/trees":
+            sha = f"t{len(self.trees) + 1}"
+            self.trees[sha] = body["tree"]
+            return 201, {"sha": sha}
+        if method == "POST" and path == "git/commits":
+            sha = f"c{len(self.commits)}"
+            self.commits[sha] = {"tree": body["tree"], "parents": body["parents"]}
+            return 201, {"sha": sha}
+        if method == "PATCH" and path == "git/refs/heads/main":
+            commit = self.commits[body["sha"]]
+            if commit["parents"] != [self.head]:
+                return 422, {"message": "Update is not a fast forward"}
+            for entry in self.trees[commit["tree"]]:
+                self.files[entry["path"]] = self.blobs[entry["sha"]]
+            self.head = body["sha"]
+            return 200, {"object": {"sha": self.head}}
+        return 404, {"message": "Not Found"}
+
+
+def _start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def fake_github(monkeypatch, tmp_path):
+    fake = FakeGitHub()
+    prefix = f"/repos/{REPO_NAME}/"
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _serve(self, method):
+            path = unquote(urlparse(self.path).path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            status, payload = fake.handle(method, path[len(prefix):] if path.startswith(prefix) else path, body)
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._serve("GET")
+
+        def do_PUT(self):
+            self._serve("PUT")
+
+        def do_POST(self):
+            self._serve("POST")
+
+        def do_PATCH(self):
+            self._serve("PATCH")
+
+    server = _start_server(Handler)
+    monkeypatch.setenv("GITHUB_TOKEN", "test-token")
+    monkeypatch.setattr(github_utils, "GITHUB_API_BASE", f"http://127.0.0.1:{server.server_port}")
+    # 关闭传输层重试，重试行为只由 UploadQueue 负责
+    monkeypatch.setattr(github_utils, "default_client", HttpClient(cache_dir=str(tmp_path), retries=0))
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+class FakeRaw:
+    """
+    raw 文件替身：按内容摘要返回 ETag，请求带匹配的 If-None-Match 时返回 304。
+    requests 记录每次请求的 (路径, If-None-Match)。
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.base_url = None
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+    def handle(self, path, if_none_match):
+        self.requests.append((path, if_none_match))
+        content = self.files.get(path.lstrip("/"))
+        if content is None:
+            return 404, {}, b""
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if if_none_match == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag}, content
+
+
+@pytest.fixture
+def fake_raw():
+    fake = FakeRaw()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            status, headers, body = fake.handle(unquote(urlparse(self.path).path), self.headers.get("If-None-Match"))
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = _start_server(Handler)
+    fake.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield fake
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,105 @@
+import subprocess
+import pytest
+import github_utils
+from github_upload import UploadQueue
+from github_utils import git_blob_sha, upload_bytes
+
+
+def _queue():
+    return UploadQueue(retries=2, backoff=0.01)
+
+
+def _writes(fake):
+    return [call for call in fake.calls if call[0] != "GET"]
+
+
+def test_git_blob_sha_matches_git():
+    content = "预测\n".encode("utf-8")
+    expected = subprocess.run(["git", "hash-object", "--stdin"], input=content, capture_output=True, check=True)
+    assert git_blob_sha(content) == expected.stdout.decode().strip()
+
+
+def test_unchanged_file_is_skipped(fake_github):
+    fake_github.files["预测.xlsx"] = b"same"
+
+    assert upload_bytes(b"same", "预测.xlsx") == ("unchanged", git_blob_sha(b"same"))
+    assert _writes(fake_github) == []
+
+
+def test_small_file_uses_contents_put(fake_github):
+    fake_github.files["预测.xlsx"] = b"old"
+
+    state, sha = upload_bytes(b"new", "预测.xlsx")
+
+    assert (state, sha) == ("uploaded", git_blob_sha(b"new"))
+    assert fake_github.files["预测.xlsx"] == b"new"
+    assert _writes(fake_github) == [("PUT", "contents/预测.xlsx")]
+
+
+def test_large_file_uses_git_data_api(fake_github, monkeypatch):
+    monkeypatch.setattr(github_utils, "UPLOAD_BLOB_THRESHOLD", 16)
+    content = bytes(range(256)) * 4
+
+    assert upload_bytes(content, "出货明细.xlsx") == ("uploaded", git_blob_sha(content))
+    assert fake_github.files["出货明细.xlsx"] == content
+    assert _writes(fake_github) == [
+        ("POST", "git/blobs"), ("POST", "git/trees"), ("POST", "git/commits"), ("PATCH", "git/refs/heads/main")
+    ]
+
+
+def test_queue_skips_content_already_uploaded(fake_github):
+    queue = _queue()
+    queue.submit("预测.xlsx", b"v1", owner="a")
+    assert queue.wait(owner="a", timeout=5)
+    calls = len(fake_github.calls)
+
+    queue.submit("预测.xlsx", b"v1", owner="a")
+
+    assert queue.statuses("a")[0]["state"] == "unchanged"
+    assert len(fake_github.calls) == calls
+
+
+@pytest.mark.parametrize("status", [409, 502])
+def test_queue_retries_conflicts_and_server_errors(fake_github, status):
+    fake_github.fail = [status, status]
+    queue = _queue()
+
+    queue.submit("预测.xlsx", b"v2", owner="a")
+    assert queue.wait(owner="a", timeout=5)
+
+    entry = queue.statuses("a")[0]
+    assert (entry["state"], entry["attempts"]) == ("uploaded", 3)
+    assert fake_github.files["预测.xlsx"] == b"v2"
+
+
+def test_queue_fails_after_retries_exhausted(fake_github):
+    fake_github.fail = [503] * 10
+    queue = _queue()
+
+    queue.submit("预测.xlsx", b"v3", owner="a")
+    assert queue.wait(owner="a", timeout=5)
+
+    entry = queue.statuses("a")[0]
+    assert (entry["state"], entry["attempts"]) == ("failed", 3)
+    assert "503" in entry["error"]
+    assert "预测.xlsx" not in fake_github.files
+
+
+def test_queue_does_not_retry_client_errors(fake_github):
+    fake_github.fail = [403]
+    queue = _queue()
+
+    queue.submit("预测.xlsx", b"v4", owner="a")
+    assert queue.wait(owner="a", timeout=5)
+
+    assert (queue.statuses("a")[0]["state"], queue.statuses("a")[0]["attempts"]) == ("failed", 1)
+
+
+def test_statuses_are_kept_per_owner(fake_github):
+    queue = _queue()
+    queue.submit("预测.xlsx", b"a", owner="session-a")
+    queue.submit("出货明细.xlsx", b"b", owner="session-b")
+    assert queue.wait(owner="session-a", timeout=5) and queue.wait(owner="session-b", timeout=5)
+
+    assert [entry["filename"] for entry in queue.statuses("session-a")] == ["预测.xlsx"]
+    assert [entry["filename"] for entry in queue.statuses("session-b")] == ["出货明细.xlsx"]
@@ -0,0 +1,37 @@
+import pytest
+from http_client import HttpClient
+
+
+def test_get_cached_revalidates_with_etag(fake_raw, tmp_path):
+    fake_raw.files["预测.xlsx"] = b"v1"
+    client = HttpClient(cache_dir=str(tmp_path), retries=0)
+    url = fake_raw.url("预测.xlsx")
+
+    assert client.get_cached(url) == b"v1"
+    assert client.get_cached(url) == b"v1"
+
+    assert client.stats() == {"revalidated": 1, "downloaded": 1}
+    first_etag, second_etag = (etag for _, etag in fake_raw.requests)
+    assert first_etag is None and second_etag is not None
+
+
+def test_get_cached_downloads_changed_file_and_updates_cache(fake_raw, tmp_path):
+    fake_raw.files["预测.xlsx"] = b"v1"
+    url = fake_raw.url("预测.xlsx")
+    HttpClient(cache_dir=str(tmp_path), retries=0).get_cached(url)
+
+    fake_raw.files["预测.xlsx"] = b"v2"
+    client = HttpClient(cache_dir=str(tmp_path), retries=0)
+    assert client.get_cached(url) == b"v2"
+    assert client.get_cached(url) == b"v2"
+
+    # 新实例从磁盘缓存读取 ETag：变化后下载一次，之后 304
+    assert client.stats() == {"revalidated": 1, "downloaded": 1}
+
+
+def test_get_cached_raises_on_error(fake_raw, tmp_path):
+    client = HttpClient(cache_dir=str(tmp_path), retries=0)
+
+    with pytest.raises(ValueError, match="HTTP 404"):
+        client.get_cached(fake_raw.url("缺失.xlsx"))
+    assert client.stats() == {"revalidated": 0, "downloaded": 0}
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import info_extract
+from info_extract import aggregate_facts, concat_facts, parse_dates
+
+
+def _facts(names, month, quantity):
+    # 与 extract_source_facts 的产出相同：品名为 object 类别
+    return aggregate_facts(pd.DataFrame({
+        "品名": pd.Categorical(pd.Series(names, dtype=object)),
+        "年月": np.full(len(names), month, dtype=np.int32),
+        "指标": pd.Categorical(["出货"] * len(names), categories=["预测", "订单", "出货"]),
+        "数量": np.full(len(names), quantity, dtype=np.float64),
+    }))
+
+
+def test_concat_facts_folds_many_chunks():
+    chunks = [_facts(["A", "B"], 24300, 1.0), _facts(["B", "C"], 24300, 2.0),
+              _facts(["C", "D"], 24301, 3.0), _facts(["A", "E"], 24301, 4.0)]
+
+    totals = chunks[0]
+    for chunk in chunks[1:]:
+        totals = aggregate_facts(concat_facts([totals, chunk]))
+
+    assert isinstance(totals["品名"].dtype, pd.CategoricalDtype)
+    result = totals.astype({"品名": object}).set_index(["品名", "年月"])["数量"].sort_index()
+    assert result.to_dict() == {
+        ("A", 24300): 1.0, ("A", 24301): 4.0, ("B", 24300): 3.0,
+        ("C", 24300): 2.0, ("C", 24301): 3.0, ("D", 24301): 3.0, ("E", 24301): 4.0,
+    }
+
+
+def test_cached_date_format_is_replaced_when_it_stops_fitting(monkeypatch):
+    monkeypatch.setattr(info_extract, "_DATE_FORMAT_CACHE", {})
+    mixed_calls = []
+    to_datetime = pd.to_datetime
+
+    def spy(values, *args, **kwargs):
+        if kwargs.get("format") == "mixed":
+            mixed_calls.append(len(values))
+        return to_datetime(values, *args, **kwargs)
+
+    monkeypatch.setattr(info_extract.pd, "to_datetime", spy)
+
+    first = parse_dates(pd.Series(["2024-01-05", "2024-02-06"], dtype=object), cache_key="sales:交易日期")
+    second = parse_dates(pd.Series(["2024/03/07", "2024/04/08"], dtype=object), cache_key="sales:交易日期")
+
+    assert first.dt.month.tolist() == [1, 2]
+    assert second.dt.month.tolist() == [3, 4]
+    assert info_extract._DATE_FORMAT_CACHE["sales:交易日期"] == "%Y/%m/%d"
+    assert mixed_calls == []
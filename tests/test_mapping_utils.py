@@ -0,0 +1,22 @@
+from mapping_utils import PartNumberGraph
+
+
+def test_self_mapping_is_not_a_cycle():
+    graph = PartNumberGraph({"A": "A", "B": "C"}, {"C": "C"})
+
+    assert graph.cycles == []
+    assert [graph.canonical(name) for name in ["A", "B", "C"]] == ["A", "C", "C"]
+
+
+def test_self_mapping_keeps_new_edge_precedence():
+    # 新旧料号 A→A 优先于替代料号 A→B：A 保持不变
+    graph = PartNumberGraph({"A": "A"}, {"A": "B"})
+
+    assert graph.canonical("A") == "A"
+
+
+def test_real_cycle_is_reported():
+    graph = PartNumberGraph({"A": "B", "B": "A", "C": "C"}, {})
+
+    assert graph.cycles == [["A", "B"]]
+    assert graph.canonical("B") == "A"
@@ -0,0 +1,55 @@
+from datetime import datetime
+from io import BytesIO
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from github_utils import INPUT_SPECS, read_excel_bytes
+from info_extract import extract_source_facts
+from mapping_utils import NEW_COLUMNS, SUB_COLUMNS, PartNumberIndex
+from stream_ingest import aggregate_source_stream
+
+SOURCE_HEADERS = {
+    "order": ["品名", "客户", "客户要求交期", "订单数量"],
+    "sales": ["品名", "客户", "交易日期", "数量"],
+}
+
+
+def _sheet_bytes(file_key, n_rows):
+    sheet_name, _ = INPUT_SPECS[file_key]
+    wb = Workbook()
+    ws = wb.active
+    ws.title = sheet_name
+    ws.append(SOURCE_HEADERS[file_key])
+    for i in range(n_rows):
+        name = "OLD1" if i % 11 == 0 else f"P{i % 37}"
+        date = datetime(2024 + i % 2, i % 12 + 1, i % 28 + 1)
+        ws.append([name, f"C{i % 5}", date if i % 3 else date.strftime("%Y-%m-%d"), i % 9 + 1])
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _part_index():
+    mapping_new = pd.DataFrame([["W", "S", "OLD1", "W", "S", "P1"]], columns=NEW_COLUMNS)
+    return PartNumberIndex(mapping_new, pd.DataFrame(columns=SUB_COLUMNS))
+
+
+def _sorted(facts):
+    keys = ["品名", "年月", "指标"]
+    facts = facts.astype({"品名": object, "指标": object})
+    return facts.sort_values(keys).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("file_key", ["order", "sales"])
+def test_stream_matches_whole_sheet(file_key):
+    content = _sheet_bytes(file_key, 500)
+    sheet_name, header = INPUT_SPECS[file_key]
+    part_index = _part_index()
+
+    streamed = aggregate_source_stream(file_key, content, sheet_name, part_index, header=header, chunk_rows=33)
+    whole = extract_source_facts(
+        file_key, read_excel_bytes(content, sheet_name=sheet_name, header=header, file_key=file_key), part_index
+    )
+
+    assert not (_sorted(streamed)["品名"] == "OLD1").any()
+    pd.testing.assert_frame_equal(_sorted(streamed), _sorted(whole), check_dtype=False)
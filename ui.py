@@ -1,9 +1,147 @@
+import os
+import uuid
 import streamlit as st
+from github_upload import default_uploader
+from info_extract import PLAN_METRICS, PLAN_YEAR
+from instrumentation import TRACE_ENABLED, TRACE_MEMORY, Tracer
+from plan_cube import BASE_COLUMNS
+from plan_viewer import QUICK_FILTERS, VIEW_MONTH_WINDOW, VIEW_PAGE_SIZE
+
+# 是否默认把上传的文件同步到 GitHub（侧边栏可逐次切换）
+GITHUB_SYNC_DEFAULT = os.environ.get("FORECAST_GITHUB_SYNC", "0") == "1"
+# 有未完成上传时状态面板的轮询间隔（秒）
+UPLOAD_POLL_SECONDS = 1
+
+UPLOAD_STATE_LABELS = {
+    "queued": "⏳ 排队中",
+    "uploading": "⬆️ 上传中",
+    "uploaded": "✅ 已上传",
+    "unchanged": "✔️ 无变化（跳过）",
+    "failed": "❌ 失败",
+}
 
 def setup_sidebar():
     st.sidebar.header("📤 工具简介")
     st.sidebar.markdown("请上传以下文件以生成主计划（不更新文件不用上传）")
 
+    plan_year = st.sidebar.number_input(
+        "📅 预测表年份（“x月预测”列所属年份）", min_value=2000, max_value=2100, value=PLAN_YEAR, step=1,
+        key="plan_year"
+    )
+
+    sync_uploads = st.sidebar.checkbox(
+        "☁️ 将上传的文件同步到 GitHub 仓库", value=GITHUB_SYNC_DEFAULT, key="sync_uploads",
+        help="勾选后，点击生成时会把本次上传的预测 / 订单 / 出货 / 模板文件提交到 GitHub（内容未变化的跳过）"
+    )
+
+    with st.sidebar.expander("⏱️ 性能追踪", expanded=False):
+        enabled = st.checkbox("记录各阶段耗时", value=TRACE_ENABLED, key="trace_enabled")
+        memory = st.checkbox("统计内存峰值（tracemalloc，较慢）", value=TRACE_MEMORY,
+                             key="trace_memory", disabled=not enabled)
+    # 每次运行使用独立的 Tracer，并发会话之间互不覆盖开关与记录
+    tracer = Tracer(enabled=enabled, memory=enabled and memory)
+    return int(plan_year), sync_uploads, tracer
+
+def session_id():
+    """
+    当前页面会话的 id，用于区分各会话的后台任务状态。
+    """
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    return st.session_state["session_id"]
+
+def show_trace_panel(trace_frame, trace_json):
+    """
+    在侧边栏展示上一次运行的分阶段追踪结果，并提供 JSON 下载。
+    """
+    with st.sidebar.expander("📋 上次运行追踪", expanded=False):
+        if trace_frame.empty:
+            st.caption("未记录（请先勾选“记录各阶段耗时”再生成）")
+            return
+        st.dataframe(trace_frame, use_container_width=True, hide_index=True)
+        st.download_button(
+            label="📥 下载追踪 JSON",
+            data=trace_json.encode("utf-8"),
+            file_name="pipeline_trace.json",
+            mime="application/json"
+        )
+
+def show_upload_status():
+    """
+    本会话的 GitHub 后台上传状态；有未完成的上传时改用定时片段轮询。
+    """
+    owner = session_id()
+    if default_uploader.pending(owner):
+        upload_status_progress(owner)
+    else:
+        _render_upload_status(owner)
+
+
+@st.fragment(run_every=UPLOAD_POLL_SECONDS)
+def upload_status_progress(owner):
+    """
+    只在有未完成上传时使用的定时片段；全部结束后整页重跑一次，停止轮询。
+    """
+    if not _render_upload_status(owner):
+        st.rerun()
+
+
+def _render_upload_status(owner):
+    statuses = default_uploader.statuses(owner)
+    if not statuses:
+        return False
+    pending = default_uploader.pending(owner)
+    with st.expander("☁️ GitHub 同步状态", expanded=pending):
+        for entry in statuses:
+            line = f"{UPLOAD_STATE_LABELS[entry['state']]} {entry['filename']}"
+            if entry.get("attempts", 0) > 1:
+                line += f"（第 {entry['attempts']} 次尝试）"
+            st.markdown(line)
+            if entry.get("error"):
+                st.caption(entry["error"])
+    return pending
+
+@st.fragment
+def show_plan_viewer(view):
+    """
+    主计划分页浏览：筛选、翻页只重跑本片段，每次只发送当前页与当前列窗口。
+    """
+    if view.n_skus == 0 or len(view.months) == 0:
+        st.info("主计划为空")
+        return
+
+    field_col, prefix_col, quick_col = st.columns([1, 2, 2])
+    field = field_col.selectbox("检索字段", BASE_COLUMNS, index=BASE_COLUMNS.index("品名"), key="viewer_field")
+    prefix = prefix_col.text_input("前缀检索（不区分大小写）", key="viewer_prefix")
+
+    months = list(view.months)
+    start, end = st.select_slider("月份区间", options=months, value=(months[0], months[-1]), key="viewer_months")
+    counts = view.quick_counts(start, end)
+    quick = quick_col.selectbox(
+        "快捷筛选", [None] + list(QUICK_FILTERS), key="viewer_quick",
+        format_func=lambda key: "全部" if key is None else f"{QUICK_FILTERS[key][0]}（{counts[key]} 项）"
+    )
+
+    rows = view.query({field: prefix}, start, end, quick)
+    i0, i1 = view.month_bounds(start, end)
+
+    page_col, window_col, metric_col = st.columns([1, 2, 2])
+    n_pages = max(1, -(-len(rows) // VIEW_PAGE_SIZE))
+    page = page_col.number_input(f"页码（共 {n_pages} 页）", min_value=1, max_value=n_pages, value=1,
+                                 step=1, key="viewer_page")
+    month_offset = 0
+    if i1 - i0 > VIEW_MONTH_WINDOW:
+        month_offset = window_col.slider("列窗口（起始月份）", 0, i1 - i0 - VIEW_MONTH_WINDOW, 0,
+                                         format="+%d 月", key="viewer_offset")
+    metrics = metric_col.multiselect("指标", PLAN_METRICS, default=PLAN_METRICS, key="viewer_metrics")
+
+    st.caption(f"共 {len(rows)} 个 SKU，显示第 {page} 页")
+    st.dataframe(
+        view.page(rows, page=min(page, n_pages) - 1, start=start, end=end, month_offset=month_offset,
+                  metrics=[m for m in PLAN_METRICS if m in metrics] or PLAN_METRICS),
+        use_container_width=True, hide_index=True
+    )
+
 def get_uploaded_files():
     st.subheader("📁 上传主计划模板")
     template_file = st.file_uploader("上传主计划模板", type="xlsx", key="template")